@@ -13,11 +13,27 @@ import os
 import sys
 import re
 import argparse
+import asyncio
+import cProfile
+import ctypes
+import hashlib
+import json
+import locale
+import platform
+import shutil
+import socket
+import struct
+import tempfile
+import threading
+import time
 import zipfile
+import zlib
 import winreg
 
+from collections import deque, namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from contextlib import contextmanager
 from shutil import rmtree
-from subprocess import run
 
 _TOOLSET_NAME = "utgtools"
 _CORE_DIR = "core"
@@ -30,18 +46,732 @@ _LAUNCHERS_DIR = "launchers"
 _PORTABLE_PYTHON_ZIP = "resources/portable_python_374.zip"  # zipped archive of WinPython portable interpreter
 _REZ_ZIP = "resources/rez.zip"  # zipped archive of Rez (cloned from https://github.com/nerdvegas/rez )
 
+_DEFAULT_JOBS = os.cpu_count() or 1  # worker threads used when extracting archives
+_EXTRACT_BUFFER_SIZE = 1024 * 1024
+_EXTRACT_MANIFEST_SUFFIX = ".manifest.json"  # written next to an extracted tree to allow incremental re-extraction
+_REZ_IMAGE_METADATA = "redrez_image.json"  # member of a rez image describing where it was captured
+_REZ_IMAGE_EXCLUDED = ("packages", "rezconfig.py")  # machine-specific content of the rez folder
+_DEFAULT_PACK_NAME = "RedistributableRez.zip"
+_DEFAULT_PACK_LEVEL = 6  # zlib compression level of pack members
+_PACK_STREAMED_MEMBER_SIZE = 64 * 1024 * 1024  # bigger files are deflated chunk by chunk straight into the pack
+_CENTRAL_DIRECTORY_SIGNATURES = (b"PK\x01\x02", b"PK\x06\x06", b"PK\x05\x06")  # records following the last member
+_CORRUPT_PACK_ERRORS = (zipfile.BadZipFile, zlib.error, EOFError)  # raised reading damaged members of a pack
+_STREAM_STAGING_DIR = ".redrez_stream"  # folder receiving the members of a streamed pack before they are placed
+_PACK_MANIFEST = "redrez_manifest.json"  # pack member mapping every packed path to its content
+_INSTALLED_MANIFEST = ".redrez_manifest.json"  # written in the core folder by deploy, describes the deployed files
+_DEPLOY_JOURNAL = ".redrez_deploy.journal"  # written next to the core folder while a pack is being unpacked
+_DEPLOY_SLOTS_DIR = ".redrez_slots"  # holds the deployed versions, the core folder being a link to the live one
+_DEPLOY_SLOTS = ("a", "b")
+_PREVIOUS_SLOT_FILE = "previous"  # in the slots folder, names the slot holding the version rollback goes back to
+_PACK_BLOBS_DIR = "blobs"  # folder of the content-addressed members of deduplicated packs
+_PACK_INDEX = "redrez_index.json"  # stored pack member mapping rez packages to the byte ranges of their members
+_PACK_INDEX_COMMENT = b"redrez-index"  # zip comment prefix giving the offset and size of the index data
+_PACKAGES_PATH = ("core", "rez", "packages")  # where rez packages live inside a pack
+_PACK_SAMPLE_SIZE = 64 * 1024  # bytes sampled from a file to measure how well it compresses
+_INCOMPRESSIBLE_RATIO = 0.95  # sampled files that don't deflate below this ratio are stored
+_FAST_DEFLATE_RATIO = 0.6  # sampled files above this ratio (e.g. binaries) get a fast level, the others the pack level
+_PACK_BATCH_SIZE = 4 * 1024 * 1024  # small files are compressed in batches of about this many bytes per worker task
+_PACK_BATCH_FILES = 256
+_PYC_INVALIDATION_MODES = ("timestamp", "checked-hash", "unchecked-hash")
+_COMPILE_EXCLUDE = r"[\\/](test[\\/]bad\w*\.py|lib2to3[\\/]tests[\\/]data)"  # sources that are not meant to compile
+_DEFAULT_BIND_PACKAGES = ("platform", "arch", "os")  # system packages rez-bind creates on every install
+_PYTHON_PACKAGE_VERSION = "3.7.4"  # version of the portable interpreter, when its headers don't tell
+_PYTHON_EXECUTABLES = ("python.exe", os.path.join("bin", "python.exe"))  # where interpreters keep it, e.g. Blender in bin
+_PYTHON_VERSION_DEFINE = re.compile(r"^#define\s+PY_(MAJOR|MINOR|MICRO)_VERSION\s+(\d+)", re.MULTILINE)
+_PACKAGE_STAMP = ".redrez_stamp.json"  # in a package family folder, fingerprint of the inputs it was last made from
+_DEFAULT_COMMAND_CONCURRENCY = max(_DEFAULT_JOBS, 8)  # external commands at once, mostly waiting on startup and I/O
+_COMMAND_TIMEOUT = 60  # seconds given to quick system commands (subst, setx, mklink)
+_BUILD_COMMAND_TIMEOUT = 30 * 60  # seconds given to install.py, rez-build, rez-bind and compileall
+_DEFAULT_FLEET_CONCURRENCY = 4  # targets deployed at once by fleet
+_DEFAULT_FLEET_RETRIES = 2
+_PROFILE_REPORT = "redrez_profile.json"  # written next to installation_log.txt, see StepTimer.write_report
+_PROFILE_FILES = (_PROFILE_REPORT, os.path.splitext(_PROFILE_REPORT)[0], _PROFILE_REPORT + ".tmp")  # never packed
+_DEFAULT_CACHE_FOLDER = os.path.join(os.environ.get("LOCALAPPDATA", tempfile.gettempdir()), "redrez", "cache")
+
+
+StepRecord = namedtuple("StepRecord", ["name", "offset", "wall", "cpu", "peak_rss", "read_bytes", "write_bytes"])
+
+
+def _windows_process_counters():
+    """
+    Return the peak working set and the bytes read and written by this process, from the Windows accounting
+    """
+    from ctypes import wintypes
+
+    class IoCounters(ctypes.Structure):
+        _fields_ = [(field, ctypes.c_ulonglong) for field in ("read_operations", "write_operations", "other_operations",
+                                                              "read_bytes", "write_bytes", "other_bytes")]
+
+    class MemoryCounters(ctypes.Structure):
+        _fields_ = [("cb", wintypes.DWORD), ("page_faults", wintypes.DWORD)] + \
+                   [(field, ctypes.c_size_t) for field in ("peak_working_set", "working_set", "peak_paged_pool",
+                                                           "paged_pool", "peak_non_paged_pool", "non_paged_pool",
+                                                           "pagefile", "peak_pagefile")]
+
+    kernel32 = ctypes.WinDLL("kernel32")
+    kernel32.GetCurrentProcess.restype = wintypes.HANDLE
+    kernel32.GetProcessIoCounters.argtypes = (wintypes.HANDLE, ctypes.POINTER(IoCounters))
+    kernel32.K32GetProcessMemoryInfo.argtypes = (wintypes.HANDLE, ctypes.POINTER(MemoryCounters), wintypes.DWORD)
+    process = kernel32.GetCurrentProcess()
+    io_counters = IoCounters()
+    memory_counters = MemoryCounters(cb=ctypes.sizeof(MemoryCounters))
+    has_io = kernel32.GetProcessIoCounters(process, ctypes.byref(io_counters))
+    has_memory = kernel32.K32GetProcessMemoryInfo(process, ctypes.byref(memory_counters), memory_counters.cb)
+    return (memory_counters.peak_working_set if has_memory else None,
+            io_counters.read_bytes if has_io else None, io_counters.write_bytes if has_io else None)
+
+
+def _process_usage():
+    """
+    Sample the resources used by this process so far, counting all its threads but not its child processes
+    :return: (CPU seconds, peak resident set size, bytes read, bytes written), sizes None when the platform doesn't tell
+    """
+    cpu = time.process_time()
+    if os.name == "nt":
+        return (cpu,) + _windows_process_counters()
+    try:
+        import resource
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+    except ImportError:
+        peak_rss = None
+    try:
+        with open("/proc/self/io", "r") as io_file:
+            counters = {key: int(value) for key, value in (line.split(":") for line in io_file)}
+        return cpu, peak_rss, counters["rchar"], counters["wchar"]
+    except (IOError, KeyError, ValueError):
+        return cpu, peak_rss, None, None
+
+
+class StepTimer(object):
+    """
+    Profile named steps: wall-clock and CPU time, peak resident memory so far and bytes read and written by the
+    process (see _process_usage). Steps can run concurrently from different threads: CPU time and I/O then count the
+    work of all of them, like wall times overlap. When profiling, every step also runs under cProfile, which sees the
+    thread running the step but not the worker threads it starts.
+    """
+
+    def __init__(self, profile=False):
+        self.start = time.perf_counter()
+        self.steps = []  # StepRecord tuples
+        self.profile = profile
+        self.profilers = {}  # step name -> cProfile.Profile of the step, when profiling
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def step(self, name):
+        profiler = cProfile.Profile() if self.profile else None
+        before = _process_usage()
+        started = time.perf_counter()
+        if profiler is not None:
+            try:
+                profiler.enable()
+            except ValueError:  # since Python 3.12 a single profiler can be active, another step holds it
+                profiler = None
+        try:
+            yield
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            finished = time.perf_counter()
+            after = _process_usage()
+            read_bytes, write_bytes = (None if after[i] is None or before[i] is None else after[i] - before[i]
+                                       for i in (2, 3))
+            with self._lock:
+                self.steps.append(StepRecord(name, started - self.start, finished - started, after[0] - before[0],
+                                             after[1], read_bytes, write_bytes))
+                if profiler is not None:
+                    self.profilers[name] = profiler
+
+    def timed(self, name, function, *args, **kwargs):
+        """
+        Run function as a step called name and return its result
+        """
+        with self.step(name):
+            return function(*args, **kwargs)
+
+    def report(self):
+        """
+        Print the collected steps in start order, with their start offset to make overlapping steps visible
+        """
+        def megabytes(size):
+            return f"{size / 1e6:10.1f}" if size is not None else f"{'-':>10}"
+
+        print(f"\nStep timings:{'start':>35} {'wall':>9} {'cpu':>9} {'read MB':>10} {'write MB':>10} {'peak MB':>10}")
+        for step in sorted(self.steps, key=lambda step: step.offset):
+            print(f"  {step.name:<36} +{step.offset:7.2f}s {step.wall:8.2f}s {step.cpu:8.2f}s "
+                  f"{megabytes(step.read_bytes)} {megabytes(step.write_bytes)} {megabytes(step.peak_rss)}")
+        print(f"  {'total':<36} {time.perf_counter() - self.start:18.2f}s")
+
+    def write_report(self, report_path, commands=()):
+        """
+        Write the collected steps, and the external commands run meanwhile, as a JSON report. When profiling, the
+        cProfile stats of every step are dumped in a folder named after the report (e.g. redrez_profile/), to be read
+        with pstats or snakeviz
+        :param commands: CommandResult tuples to include
+        :return: path of the report
+        """
+        report = {"argv": sys.argv, "started": time.time() - (time.perf_counter() - self.start),
+                  "total": time.perf_counter() - self.start,
+                  "steps": [step._asdict() for step in sorted(self.steps, key=lambda step: step.offset)],
+                  "commands": [{"name": command.name, "returncode": command.returncode, "wall": command.wall,
+                                "cpu": command.cpu, "error": command.error} for command in commands]}
+        if self.profilers:
+            profile_folder = os.path.splitext(report_path)[0]
+            rmtree(profile_folder, ignore_errors=True)  # stats of the previous run, possibly hardlinked to another slot
+            os.makedirs(profile_folder)
+            for index, step in enumerate(report["steps"]):
+                profiler = self.profilers.get(step["name"])
+                if profiler is not None:
+                    file_name = re.sub(r"[^\w.-]+", "_", step["name"])
+                    step["profile"] = os.path.join(profile_folder, f"{index:02}-{file_name}.prof")
+                    profiler.dump_stats(step["profile"])
+        temp_path = report_path + ".tmp"
+        with open(temp_path, "w") as report_file:
+            json.dump(report, report_file, indent=1)
+        os.replace(temp_path, report_path)  # never written through a hardlink shared with another slot
+        return report_path
+
+
+CommandResult = namedtuple("CommandResult", ["name", "returncode", "output", "wall", "cpu", "error"])
+
+
+def _process_cpu_clock(pid):
+    """
+    Return a function giving the CPU time (user + kernel seconds) a child process used, or None where unsupported.
+    On Windows the process handle is opened while the child runs, which keeps its accounting readable once it exited.
+    """
+    if os.name != "nt":
+        return lambda: None
+    from ctypes import wintypes
+    kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+    kernel32.OpenProcess.restype = wintypes.HANDLE
+    kernel32.OpenProcess.argtypes = (wintypes.DWORD, wintypes.BOOL, wintypes.DWORD)
+    kernel32.GetProcessTimes.argtypes = (wintypes.HANDLE,) + (ctypes.POINTER(wintypes.FILETIME),) * 4
+    kernel32.CloseHandle.argtypes = (wintypes.HANDLE,)
+    handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+
+    def cpu_time():
+        if not handle:
+            return None
+        times = [wintypes.FILETIME() for _ in range(4)]  # creation, exit, kernel, user
+        succeeded = kernel32.GetProcessTimes(handle, *(ctypes.byref(filetime) for filetime in times))
+        kernel32.CloseHandle(handle)
+        if not succeeded:
+            return None
+        return sum(filetime.dwHighDateTime << 32 | filetime.dwLowDateTime for filetime in times[2:]) / 1e7
+    return cpu_time
+
+
+class CommandRunner(object):
+    """
+    Run external commands on an asyncio event loop, at most concurrency of them at once across all threads.
+    The stdout and stderr lines of every command are printed as they come, prefixed with the command name, and kept in
+    its result along with the wall and CPU time it took, so independent commands overlap and slow ones stand out.
+    """
+
+    def __init__(self, concurrency=_DEFAULT_COMMAND_CONCURRENCY):
+        self.results = []  # CommandResult of every command run, in completion order
+        self._slots = threading.BoundedSemaphore(concurrency)
+        self._lock = threading.Lock()
+
+    def run(self, commands, echo=True):
+        """
+        Run commands concurrently
+        :param commands: list of (name, args, cwd, timeout) tuples, cwd and timeout (in seconds) can be None
+        :param echo: print the output lines of the commands
+        :return: list of CommandResult, in the order of commands. The return code is None if the command couldn't
+                 start or timed out, error telling which
+        """
+        # Python 3.7 defaults to an event loop that can't run subprocesses on Windows
+        loop = asyncio.ProactorEventLoop() if os.name == "nt" else asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            return loop.run_until_complete(self._run_all(commands, echo))
+        finally:
+            asyncio.set_event_loop(None)
+            loop.close()
+
+    def call(self, name, args, cwd=None, timeout=_COMMAND_TIMEOUT, echo=True):
+        """
+        Run a single command
+        :return: its CommandResult
+        """
+        return self.run([(name, args, cwd, timeout)], echo)[0]
+
+    async def _run_all(self, commands, echo):
+        return await asyncio.gather(*(self._run(*command, echo) for command in commands))
+
+    async def _run(self, name, args, cwd, timeout, echo):
+        await asyncio.get_event_loop().run_in_executor(None, self._slots.acquire)
+        try:
+            result = await self._execute(name, args, cwd, timeout, echo)
+        finally:
+            self._slots.release()
+        with self._lock:
+            self.results.append(result)
+        return result
+
+    async def _execute(self, name, args, cwd, timeout, echo):
+        started = time.perf_counter()
+        try:
+            process = await asyncio.create_subprocess_exec(*args, cwd=cwd, stdin=asyncio.subprocess.DEVNULL,
+                                                           stdout=asyncio.subprocess.PIPE,
+                                                           stderr=asyncio.subprocess.PIPE)
+        except OSError as e:
+            return CommandResult(name, None, "", time.perf_counter() - started, None, f"could not start: {e}")
+        cpu_clock = _process_cpu_clock(process.pid)
+        encoding = locale.getpreferredencoding(False)
+        lines = []
+
+        def add_line(line):
+            line = line.decode(encoding, errors="replace").rstrip("\r")
+            lines.append(line)
+            if echo:
+                print(f"[{name}] {line}")
+
+        async def pump(stream):
+            # Read in chunks rather than lines: a long line (e.g. a progress bar) would overrun readline's limit
+            pending = b""
+            while True:
+                chunk = await stream.read(_EXTRACT_BUFFER_SIZE)
+                if not chunk:
+                    break
+                *complete, pending = (pending + chunk).split(b"\n")
+                for line in complete:
+                    add_line(line)
+            if pending:
+                add_line(pending)
+
+        error = None
+        try:
+            await asyncio.wait_for(asyncio.gather(pump(process.stdout), pump(process.stderr), process.wait()), timeout)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            error = f"timed out after {timeout}s"
+        return CommandResult(name, None if error else process.returncode, "\n".join(lines),
+                             time.perf_counter() - started, cpu_clock(), error)
+
+    def report(self):
+        """
+        Print the commands run so far, slowest first, with their wall and CPU time
+        """
+        if not self.results:
+            return
+        print("\nCommand timings:                          wall       cpu")
+        for result in sorted(self.results, key=lambda result: result.wall, reverse=True):
+            cpu = f"{result.cpu:8.2f}s" if result.cpu is not None else f"{'-':>9}"
+            status = result.error or (f"exit code {result.returncode}" if result.returncode else "")
+            print(f"  {result.name:<36} {result.wall:8.2f}s {cpu}  {status}".rstrip())
+
+
+_RUNNER = CommandRunner()  # runs every external command of redrez
+
+
+class ZipHandles(object):
+    """
+    Hand out one ZipFile handle per worker thread, so seeks on the archive never contend on a shared lock
+    """
+
+    def __init__(self, zip_path):
+        self.zip_path = zip_path
+        self._thread_data = threading.local()
+        self._handles = []
+        self._lock = threading.Lock()
+
+    def get(self):
+        zip_ref = getattr(self._thread_data, "zip_ref", None)
+        if zip_ref is None:
+            zip_ref = self._thread_data.zip_ref = zipfile.ZipFile(self.zip_path, 'r')
+            with self._lock:
+                self._handles.append(zip_ref)
+        return zip_ref
+
+    def close(self):
+        for zip_ref in self._handles:
+            zip_ref.close()
+
+
+TreeEntry = namedtuple("TreeEntry", ["path", "size", "mtime", "mode"])
+
+
+def _scan_folder(folder):
+    """
+    List a single folder with os.scandir, reusing the stat information of its entries
+    :return: (list of TreeEntry for the files, list of subfolder paths)
+    """
+    files = []
+    subfolders = []
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subfolders.append(entry.path)
+                elif entry.is_file():
+                    entry_stat = entry.stat()
+                    files.append(TreeEntry(entry.path, entry_stat.st_size, entry_stat.st_mtime, entry_stat.st_mode))
+            except OSError:
+                continue  # vanished while walking, or a broken link
+    return files, subfolders
+
+
+def walk_tree(folder, jobs=None):
+    """
+    Walk a folder tree, listing its subfolders concurrently. On network shares every listing is a round trip,
+    so they are overlapped, and the stat results come from the listings instead of a stat call per file.
+    Files are yielded as their folder is listed, in no particular order.
+    :param folder: root of the tree
+    :param jobs: number of folders listed at once
+    :return: generator of TreeEntry (path, size, mtime, mode)
+    """
+    with ThreadPoolExecutor(max_workers=jobs or _DEFAULT_JOBS) as pool:
+        pending = {pool.submit(_scan_folder, folder)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                files, subfolders = future.result()
+                pending.update(pool.submit(_scan_folder, subfolder) for subfolder in subfolders)
+                yield from files
+
+
+def disk_usage(folder, jobs=None):
+    """
+    Measure a folder tree with walk_tree
+    :return: (number of files, total size in bytes)
+    """
+    files = 0
+    size = 0
+    for entry in walk_tree(folder, jobs):
+        files += 1
+        size += entry.size
+    return files, size
+
+
+def _file_size(path):
+    """
+    Return the size of a file, or None if it doesn't exist
+    """
+    try:
+        return os.stat(path).st_size
+    except OSError:
+        return None
+
+
+def _remove_file(path):
+    """
+    Remove a file if it exists
+    """
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _remove_stale_members(destination, previous_entries, entries):
+    """
+    Remove the extracted files of members listed in a previous manifest but not in the current one
+    """
+    for name in previous_entries.keys() - entries.keys():
+        try:
+            _remove_file(_member_target_path(destination, name))
+        except OSError:
+            pass
+
+
+def _member_target_path(destination, member_name):
+    """
+    Return the path a zip member is extracted to, dropping drive letters and '..' components like zipfile does
+    """
+    parts = [part for part in member_name.replace("\\", "/").split("/") if part not in ("", ".", "..")]
+    if parts:
+        parts[0] = os.path.splitdrive(parts[0])[1] or parts[0]
+    return os.path.join(destination, *parts)
+
+
+def _extract_member(zip_ref, member, target_path, sha256=None):
+    """
+    Extract a single member to target_path.
+    If sha256 is given the content is hashed while it is written, and zipfile.BadZipFile is raised on a mismatch
+    """
+    _remove_file(target_path)  # never write through a hardlink shared with the extraction cache
+    with zip_ref.open(member) as source, open(target_path, "wb") as target:
+        if sha256 is None:
+            shutil.copyfileobj(source, target, _EXTRACT_BUFFER_SIZE)
+            return
+        digest = hashlib.sha256()
+        for chunk in iter(lambda: source.read(_EXTRACT_BUFFER_SIZE), b""):
+            digest.update(chunk)
+            target.write(chunk)
+    if digest.hexdigest() != sha256:
+        raise zipfile.BadZipFile(f"Bad SHA-256 for {member.filename}")
+
+
+def extraction_manifest_path(zip_path, destination):
+    """
+    Return the path of the manifest describing what zip_path extracted into destination
+    """
+    return os.path.join(destination, f".{os.path.basename(zip_path)}{_EXTRACT_MANIFEST_SUFFIX}")
+
+
+def read_extraction_manifest(manifest_path):
+    """
+    Read an extraction manifest
+    :return: dictionary of member name -> [size, CRC32], empty if the manifest is missing or unreadable
+    """
+    try:
+        with open(manifest_path, "r") as manifest_file:
+            return json.load(manifest_file)["members"]
+    except (IOError, ValueError, KeyError):
+        return {}
+
+
+def write_extraction_manifest(manifest_path, members):
+    """
+    Atomically write an extraction manifest
+    :param members: dictionary of member name -> [size, CRC32]
+    """
+    temp_path = manifest_path + ".tmp"
+    with open(temp_path, "w") as manifest_file:
+        json.dump({"members": members}, manifest_file)
+    os.replace(temp_path, manifest_path)
+
+
+def extract_zip(zip_path, destination, jobs=None, incremental=False):
+    """
+    Extract a zip archive handing its members out to a pool of worker threads.
+    The whole directory tree is created up front, then file members are extracted largest first so that a big member
+    never ends up alone at the tail of the job. zlib releases the GIL while inflating, so this scales with cores.
+    When incremental, a manifest with name, size and CRC32 of every member (read from the zip central directory) is kept
+    next to the extracted tree: only members whose entry changed or whose file is missing are rewritten, and files of
+    members no longer in the archive are removed.
+    :param zip_path: path of the zip archive
+    :param destination: folder the archive is extracted into
+    :param jobs: number of worker threads, defaults to the number of cores
+    :param incremental: skip members that are already extracted and unchanged
+    :return: number of extracted files
+    """
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        members = zip_ref.infolist()
+
+    manifest_path = extraction_manifest_path(zip_path, destination)
+    previous_entries = read_extraction_manifest(manifest_path) if incremental else {}
+    entries = {}
+    kept_entries = {}
+    folders = {destination}
+    files = []
+    for member in members:
+        target_path = _member_target_path(destination, member.filename)
+        if member.is_dir():
+            folders.add(target_path)
+            continue
+        entry = [member.file_size, member.CRC]
+        entries[member.filename] = entry
+        if previous_entries.get(member.filename) == entry and _file_size(target_path) == member.file_size:
+            kept_entries[member.filename] = entry
+            continue
+        folders.add(os.path.dirname(target_path))
+        files.append((member, target_path))
+
+    _remove_stale_members(destination, previous_entries, entries)
+    if incremental:
+        # Until the extraction completes, the manifest only vouches for the members that are left untouched
+        os.makedirs(destination, exist_ok=True)
+        write_extraction_manifest(manifest_path, kept_entries)
+
+    for folder in sorted(folders):
+        os.makedirs(folder, exist_ok=True)
+    files.sort(key=lambda item: item[0].file_size, reverse=True)
+
+    handles = ZipHandles(zip_path)
+    try:
+        with ThreadPoolExecutor(max_workers=jobs or _DEFAULT_JOBS) as pool:
+            for _ in pool.map(lambda item: _extract_member(handles.get(), *item), files):
+                pass
+    finally:
+        handles.close()
+
+    if incremental:
+        write_extraction_manifest(manifest_path, entries)
+    return len(files)
+
+
+def file_digest(file_path):
+    """
+    Return the SHA-256 hex digest of a file, e.g. to key the extraction cache with an archive
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as source:
+        for chunk in iter(lambda: source.read(_EXTRACT_BUFFER_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cached_extract(zip_path, cache_folder, jobs=None):
+    """
+    Extract an archive once into a machine-wide cache folder, keyed by the archive hash, and reuse it afterwards.
+    The extraction goes to a private staging folder that is renamed into place only when complete, so concurrent
+    installs never see a partially extracted entry.
+    :param zip_path: path of the zip archive
+    :param cache_folder: root folder of the extraction cache
+    :param jobs: number of worker threads used for the extraction
+    :return: folder holding the extracted archive
+    """
+    cache_entry = os.path.join(cache_folder, file_digest(zip_path))
+    if os.path.isdir(cache_entry):
+        return cache_entry
+
+    staging_folder = f"{cache_entry}.{os.getpid()}.partial"
+    extract_zip(zip_path, staging_folder, jobs, incremental=True)  # the manifest travels with the cached tree
+    try:
+        os.rename(staging_folder, cache_entry)
+    except OSError:
+        # Another install filled the same entry in the meantime
+        rmtree(staging_folder, ignore_errors=True)
+        if not os.path.isdir(cache_entry):
+            raise
+    return cache_entry
+
+
+def materialise_tree(source_folder, destination, jobs=None, force=False):
+    """
+    Recreate a folder tree in destination using hardlinks, falling back to a copy when linking is not possible
+    (e.g. source and destination on different devices).
+    Linked files are shared with the source, so they must be replaced and never modified in place.
+    :param source_folder: folder to recreate
+    :param destination: folder the tree is recreated into
+    :param jobs: number of worker threads
+    :param force: recreate files that are already linked to the source
+    :return: number of files linked or copied
+    """
+    files = []
+    for root, dirs, filenames in os.walk(source_folder):
+        target_root = os.path.join(destination, os.path.relpath(root, source_folder))
+        os.makedirs(target_root, exist_ok=True)
+        files.extend((os.path.join(root, filename), os.path.join(target_root, filename)) for filename in filenames)
+
+    def materialise_file(item):
+        source_path, target_path = item
+        try:
+            if not force and os.path.samefile(source_path, target_path):
+                return 0
+        except OSError:
+            pass
+        _remove_file(target_path)
+        try:
+            os.link(source_path, target_path)
+        except OSError:
+            shutil.copy2(source_path, target_path)
+        return 1
+
+    with ThreadPoolExecutor(max_workers=jobs or _DEFAULT_JOBS) as pool:
+        return sum(pool.map(materialise_file, files))
+
+
+def install_from_cache(zip_path, destination, cache_folder, jobs=None, force=False):
+    """
+    Install an archive into destination by hardlinking its tree from the extraction cache.
+    Files of members that left the archive since the previous install are removed.
+    :return: number of files linked or copied
+    """
+    cache_entry = cached_extract(zip_path, cache_folder, jobs)
+    previous_entries = read_extraction_manifest(extraction_manifest_path(zip_path, destination))
+    entries = read_extraction_manifest(extraction_manifest_path(zip_path, cache_entry))
+    _remove_stale_members(destination, previous_entries, entries)
+    return materialise_tree(cache_entry, destination, jobs, force)
+
+
+# Build script of the python package, run by the portable interpreter itself. The package is made of hardlinks to the
+# interpreter files, so building it costs almost no I/O; files are copied where linking is not possible (another
+# volume, a file system without hardlinks). The interpreter folder is passed on the command line: the package definition
+# lives in a staging folder of its own, so nothing is written in interpreters shipped with DCCs. Build files left in the
+# interpreter folder by in-place builds are skipped.
+_PYTHON_REZBUILD_SCRIPT = """import os
+import sys
+import shutil
+import logging
+from concurrent.futures import ThreadPoolExecutor
+logging.basicConfig(level=logging.INFO)
+log = logging.getLogger()
+
+COPY_BUFFER_SIZE = 8 * 1024 * 1024
+SKIPPED_FILES = ('package.py', 'rezbuild.py')
+SKIPPED_FOLDERS = ('build',)
+
+
+def install_file(source_file, target_file):
+    if os.path.lexists(target_file):
+        os.remove(target_file)  # never write through a link to a previous install
+    try:
+        os.link(source_file, target_file)
+        return 'linked'
+    except OSError:
+        pass
+    with open(source_file, 'rb') as source, open(target_file, 'wb') as target:
+        shutil.copyfileobj(source, target, COPY_BUFFER_SIZE)
+    shutil.copystat(source_file, target_file)
+    return 'copied'
+
+
+def build(interpreter_path, build_path, install_path, targets):
+    print(interpreter_path)
+    print(build_path)
+    print(install_path)
+    logging.info('Prepare build...')
+    if 'install' not in (targets or []):
+        return
+    logging.info('Link files to install target path...')
+    files = []
+    for root, dirs, filenames in os.walk(interpreter_path):
+        if root == interpreter_path:
+            dirs[:] = [folder for folder in dirs if folder not in SKIPPED_FOLDERS]
+            filenames = [filename for filename in filenames if filename not in SKIPPED_FILES]
+        target_root = os.path.normpath(os.path.join(install_path, os.path.relpath(root, interpreter_path)))
+        os.makedirs(target_root, exist_ok=True)
+        files.extend((os.path.join(root, filename), os.path.join(target_root, filename)) for filename in filenames)
+    with ThreadPoolExecutor(max_workers=os.cpu_count() or 1) as pool:
+        results = list(pool.map(lambda item: install_file(*item), files))
+    logging.info('%d files linked, %d copied', results.count('linked'), results.count('copied'))
+
+
+if __name__ == '__main__':
+    build(interpreter_path=sys.argv[1],
+          build_path=os.environ['REZ_BUILD_PATH'],
+          install_path=os.environ['REZ_BUILD_INSTALL_PATH'],
+          targets=sys.argv[2:])
+"""
+
+
+def interpreter_executable(interpreter_folder):
+    """
+    Find the python.exe file of an interpreter, at the root of its folder or in its bin folder
+    :return: path of python.exe, None if there isn't one
+    """
+    for executable in _PYTHON_EXECUTABLES:
+        if os.path.isfile(os.path.join(interpreter_folder, executable)):
+            return os.path.join(interpreter_folder, executable)
+    return None
+
 
-def create_python_pakage_file(interpreter_folder, version):
+def create_python_pakage_file(package_folder, version, interpreter_folder, executable):
     """
-    Create a package.py file used to rez-build an embedded interpreter
-    :param interpreter_folder: folder of the python.exe file
+    Create a package.py file used to rez-build an embedded interpreter. The build runs the interpreter itself on the
+    rezbuild.py file next to the package.py one, and puts the folder of its python.exe file in the PATH
+    :param package_folder: folder receiving the package.py file
     :param version: Python (and package) version
+    :param interpreter_folder: folder of the interpreter, packaged as it is
+    :param executable: path of the python.exe file of the interpreter
     """
+    executable_folder = os.path.relpath(os.path.dirname(executable), interpreter_folder).replace(os.sep, "/")
+    executable_folder = "" if executable_folder == "." else "/" + executable_folder
+    executable = executable.replace(os.sep, "/")
+    interpreter_folder = interpreter_folder.replace(os.sep, "/")
     try:
-        package_build_file = open(os.path.join(interpreter_folder, "package.py"), "w+")
-        package_build_file.write(f"import os\n\nname = 'python'\nversion = '{version}'\nbuild_command = '{{root}}/python {{root}}/rezbuild.py {{install}}'\n\n"
+        package_build_file = open(os.path.join(package_folder, "package.py"), "w+")
+        package_build_file.write(f"import os\n\nname = 'python'\nversion = '{version}'\n"
+                                 f"build_command = '\"{executable}\" \"{{root}}/rezbuild.py\" \"{interpreter_folder}\" "
+                                 f"{{install}}'\n\n"
                                  f"def commands():\n\t"
-                                 f"env.PATH.append('{{root}}')\n\t"
+                                 f"env.PATH.append('{{root}}{executable_folder}')\n\t"
                                  f"env.PYTHONPATH.append('{{root}}')\n")
         package_build_file.close()
     except IOError as e:
@@ -50,35 +780,38 @@ def create_python_pakage_file(interpreter_folder, version):
     return True
 
 
-def create_python_rezbuild_file(interpreter_folder):
+def interpreter_version(interpreter_folder):
     """
-    Create a rezbuild.py file used to rez-build an embedded interpreter
-    :param interpreter_folder: folder of the python.exe file
-    :param version: Python (and package) version
+    Read the version of a Python interpreter from its headers (include/patchlevel.h), without starting it.
+    Both the Windows layout and the include/pythonX.Y one shipped by some DCCs are looked up.
+    :return: version as X.Y.Z, None if no header tells it
     """
+    include_folder = os.path.join(interpreter_folder, "include")
+    headers = [os.path.join(include_folder, "patchlevel.h")]
     try:
-        rezbuild_file = open(os.path.join(interpreter_folder, "rezbuild.py"), "w+")
-        rezbuild_file.write(f"import os\n"
-                                 f"import sys\n"
-                                 f"import logging\n"
-                                 f"from distutils.dir_util import copy_tree\n"
-                                 f"logging.basicConfig(level=logging.INFO)\n"
-                                 f"log = logging.getLogger()\n\n\n"
-                                 f"def build(source_path, build_path, install_path, targets):\n\t"
-                                 f"print(source_path)\n\t"
-                                 f"print(build_path)\n\t"
-                                 f"print(install_path)\n\t"
-                                 f"logging.info('Prepare build...')\n\t"
-                                 f"if 'install' not in (targets or []):\n\t\t"
-                                 f"return\n\t"
-                                 f"logging.info('Copy files to install target path...')\n\t"
-                                 f"# Copy files to repository\n\t"
-                                 f"copy_tree(source_path, install_path)\n\n\n"
-                                 f"if __name__ == '__main__':\n\t"
-                                 f"build(source_path=os.environ['REZ_BUILD_SOURCE_PATH'],\n\t"
-                                 f"      build_path=os.environ['REZ_BUILD_PATH'],\n\t"
-                                 f"      install_path=os.environ['REZ_BUILD_INSTALL_PATH'],\n\t"
-                                 f"      targets=sys.argv[1:])\n")
+        headers.extend(sorted(os.path.join(entry.path, "patchlevel.h") for entry in os.scandir(include_folder)
+                              if entry.is_dir() and entry.name.startswith("python")))
+    except OSError:
+        pass
+    for header in headers:
+        try:
+            with open(header, "r", errors="replace") as header_file:
+                parts = dict(_PYTHON_VERSION_DEFINE.findall(header_file.read()))
+        except IOError:
+            continue
+        if len(parts) == 3:
+            return f"{parts['MAJOR']}.{parts['MINOR']}.{parts['MICRO']}"
+    return None
+
+
+def create_python_rezbuild_file(package_folder):
+    """
+    Create a rezbuild.py file used to rez-build an embedded interpreter (see _PYTHON_REZBUILD_SCRIPT)
+    :param package_folder: folder receiving the rezbuild.py file, next to the package.py one
+    """
+    try:
+        rezbuild_file = open(os.path.join(package_folder, "rezbuild.py"), "w+")
+        rezbuild_file.write(_PYTHON_REZBUILD_SCRIPT)
         rezbuild_file.close()
     except IOError as e:
         print(f"Error while writing rezbuild.py file for Python interpreter\n{e}")
@@ -86,6 +819,13 @@ def create_python_rezbuild_file(interpreter_folder):
     return True
 
 
+def release_packages_path_for(release_folder):
+    """
+    Return the packages folder rez releases to inside a remote release folder
+    """
+    return release_folder + r"\\" + r"\.rez\packages"
+
+
 def setup_folder_structure(local_folder, unit=None, release_folder=None):
     """
     Create all needed folders and optionally remap local folder to a new unit
@@ -97,8 +837,9 @@ def setup_folder_structure(local_folder, unit=None, release_folder=None):
     if unit is not None and re.fullmatch("[a-z]", unit.lower()) and not os.path.exists(unit.upper()+":\\"):
         try:
             remap_to = unit.upper()
-            run(["subst", (remap_to.upper() + ":"),
-                 install_folder])  # Immediately remap the folder for the current session
+            # Immediately remap the folder for the current session
+            if _RUNNER.call("subst", ["subst", (remap_to.upper() + ":"), install_folder]).returncode != 0:
+                raise OSError(f"subst {remap_to}: failed")
             print(f"{install_folder} is remapped to {remap_to} unit")
 
             if True:
@@ -125,7 +866,7 @@ def setup_folder_structure(local_folder, unit=None, release_folder=None):
             exit()
 
     if release_folder is not None:
-        release_packages_folder = release_folder + r"\\" + r"\.rez\packages"
+        release_packages_folder = release_packages_path_for(release_folder)
         if not os.path.exists(release_packages_folder):
             try:
                 os.makedirs(release_packages_folder)
@@ -138,18 +879,23 @@ def setup_folder_structure(local_folder, unit=None, release_folder=None):
     return install_folder, release_packages_folder
 
 
-def setup_rezconfig_file(local_packages_folder, release_packages_path):
+def setup_rezconfig_file(local_packages_folder, release_packages_path, config_folder=None, set_env=True):
     """
     Write a rezconfig.py file for packages folder settings and create an env var to let rez reading it
+    :param config_folder: folder the file is written to, when it is not yet at its final place (see deploy_pack)
+    :param set_env: set the env vars, False when the file is written for another machine
     """
 
     rez_config_filename = os.path.join((os.path.split(local_packages_folder)[0]), "rezconfig.py")
-    os.environ["REZ_CONFIG_FILE"] = rez_config_filename
-    run(["setx.exe", "REZ_CONFIG_FILE", rez_config_filename])
-    print(f"\nREZ_CONFIG_FILE set to: {os.environ.get('REZ_CONFIG_FILE')}\n")
+    if set_env:
+        os.environ["REZ_CONFIG_FILE"] = rez_config_filename
+        _RUNNER.call("setx REZ_CONFIG_FILE", ["setx.exe", "REZ_CONFIG_FILE", rez_config_filename])
+        print(f"\nREZ_CONFIG_FILE set to: {os.environ.get('REZ_CONFIG_FILE')}\n")
 
     try:
-        rez_config_file = open(os.path.join(rez_config_filename), "w+")
+        written_filename = os.path.join(config_folder, "rezconfig.py") if config_folder else rez_config_filename
+        _remove_file(written_filename)  # may be hardlinked to another slot
+        rez_config_file = open(written_filename, "w+")
         rez_config_file.write(f"# The package search path. Rez uses this to find packages. A package with the\n"
                               f"# same name and version in an earlier path takes precedence.\n"
                               f"packages_path = [\n\tr\"{local_packages_folder}\",\n\tr\"{release_packages_path}\"]\n")
@@ -161,14 +907,16 @@ def setup_rezconfig_file(local_packages_folder, release_packages_path):
                                   f"# The path that Rez will deploy packages to when rez-release is used. For\n"
                                   f"# production use, you will probably want to change this to a site-wide location.\n"
                                   f"release_packages_path = r\"{release_packages_path}\"")
-            os.environ["REZ_RELEASE_PACKAGES_PATH"] = release_packages_path
+            if set_env:
+                os.environ["REZ_RELEASE_PACKAGES_PATH"] = release_packages_path
 
     except IOError:
         print(f"An error has occurred while creating rezconfig.py")
         exit()
 
     # Add the packages paths to current env
-    os.environ["REZ_LOCAL_PACKAGES_PATH"] = local_packages_folder
+    if set_env:
+        os.environ["REZ_LOCAL_PACKAGES_PATH"] = local_packages_folder
 
     return rez_config_filename
 
@@ -189,110 +937,1922 @@ def add_rez_to_path(rez_bin_folder):
         pass
 
 
-def rez_build_machine_packages(rez_bin_folder, python_interpreter_folder):
+def _fingerprint(state):
+    """
+    Return a digest of a JSON serialisable state
+    """
+    return hashlib.sha256(json.dumps(state, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _interpreter_fingerprint(python_interpreter_folder):
+    """
+    Fingerprint the interpreter tree rez-build installs. The extraction manifest of the portable Python gives the
+    names, sizes and CRC32 of its files for free; without one, the files are walked and hashed. Only contents count,
+    not modification times, so the same interpreter installed on two machines gives the same fingerprint.
+    Build files left by in-place builds (package.py, rezbuild.py, the build folder) are left out, as rez-build does.
+    """
+    core_folder, interpreter_name = os.path.split(os.path.normpath(python_interpreter_folder))
+    members = read_extraction_manifest(extraction_manifest_path(_PORTABLE_PYTHON_ZIP, core_folder))
+    state = sorted([name, *entry] for name, entry in members.items() if name.startswith(interpreter_name + "/"))
+    if not state:
+        generated = {"package.py", "rezbuild.py"}
+        files = {}
+        for entry in walk_tree(python_interpreter_folder):
+            path = os.path.relpath(entry.path, python_interpreter_folder).replace(os.sep, "/")
+            if path not in generated and not path.startswith("build/"):
+                files[entry.path] = [path, entry.size]
+        digests = _hash_files(list(files), _DEFAULT_JOBS)
+        state = sorted(files[file_path] + [digests[file_path]] for file_path in files)
+    return _fingerprint(state)
+
+
+def _same_volume(path, other_path):
+    """
+    Tell whether two paths, or their closest existing parent folders, are on the same volume, where hardlinks work
+    """
+    def device(device_path):
+        device_path = os.path.abspath(device_path)
+        while not os.path.exists(device_path) and os.path.dirname(device_path) != device_path:
+            device_path = os.path.dirname(device_path)
+        return os.stat(device_path).st_dev
+
+    try:
+        return device(path) == device(other_path)
+    except OSError:
+        return False
+
+
+def _package_installed(packages_folder, family, version=None):
+    """
+    Tell whether the local packages folder holds the given version of a package, or any version if version is None
+    """
+    family_folder = os.path.join(packages_folder, family)
+    if version is not None:
+        return os.path.isfile(os.path.join(family_folder, version, "package.py"))
+    try:
+        return any(entry.is_dir() and os.path.isfile(os.path.join(entry.path, "package.py"))
+                   for entry in os.scandir(family_folder))
+    except OSError:
+        return False
+
+
+def read_package_stamp(packages_folder, family, version=None):
     """
-    Build some essential rez packages for the user's machine
+    Return the fingerprint stamped in a package family (or version) folder, None if there isn't one
     """
-    # rez-build WinPython package. This will be the default Python package used by rez
-    os.chdir(python_interpreter_folder)
-    create_python_pakage_file(python_interpreter_folder, "3.7.4")
-    create_python_rezbuild_file(python_interpreter_folder)
-    run([os.path.join(rez_bin_folder, "rez-build"), "-i"])
+    try:
+        with open(os.path.join(packages_folder, family, version or "", _PACKAGE_STAMP), "r") as stamp_file:
+            return json.load(stamp_file)["fingerprint"]
+    except (IOError, ValueError, KeyError):
+        return None
+
+
+def write_package_stamp(packages_folder, family, version, fingerprint):
+    """
+    Stamp a package family (or version, if not None) folder with the fingerprint of the inputs it was made from
+    """
+    stamp_path = os.path.join(packages_folder, family, version or "", _PACKAGE_STAMP)
+    temp_path = stamp_path + ".tmp"
+    with open(temp_path, "w") as stamp_file:
+        json.dump({"fingerprint": fingerprint}, stamp_file)
+    os.replace(temp_path, stamp_path)  # never written through a hardlink shared with another slot
+
+
+def python_package_builds(rez_bin_folder, interpreters, build_folder):
+    """
+    Write the package definition of every interpreter and return the rez-build commands making their python packages.
+    When several interpreters share a version the first one is packaged. The definitions are written in build_folder,
+    one folder per version, rather than in the interpreter folders: those shipped with DCCs may be read-only.
+    :param rez_bin_folder: folder of the rez executables
+    :param interpreters: list of (interpreter folder, version used when its headers don't tell it, or None)
+    :param build_folder: folder receiving the package definitions, rez-build runs from there
+    :return: (list of (name, args, cwd, family, version, inputs, interpreter folder) build candidates,
+              list of names that failed to prepare)
+    """
+    candidates = []
+    failures = []
+    versions = {}
+    for folder, fallback_version in interpreters:
+        name = f"rez-build python ({folder})"
+        version = interpreter_version(folder) or fallback_version
+        if version is None:
+            print(f"[{name}] no include/patchlevel.h telling the interpreter version")
+            failures.append(name)
+            continue
+        if version in versions:
+            print(f"[{name}] python-{version} already made from {versions[version]}, skipped")
+            continue
+        executable = interpreter_executable(folder)
+        if executable is None:
+            print(f"[{name}] no python.exe at the root or in the bin folder of the interpreter")
+            failures.append(name)
+            continue
+        versions[version] = folder
+        package_folder = os.path.join(build_folder, f"python-{version}")
+        os.makedirs(package_folder, exist_ok=True)
+        if not (create_python_pakage_file(package_folder, version, folder, executable) and
+                create_python_rezbuild_file(package_folder)):
+            failures.append(name)
+            continue
+        generated_files = {}
+        for file in ("package.py", "rezbuild.py"):
+            with open(os.path.join(package_folder, file), "r") as generated_file:
+                # Where the interpreter is installed doesn't change the package other machines can reuse
+                generated_files[file] = generated_file.read().replace(folder.replace(os.sep, "/"), "{interpreter}")
+        candidates.append((f"rez-build python-{version}", [os.path.join(rez_bin_folder, "rez-build"), "-i"],
+                           package_folder, "python", version,
+                           {"tree": _interpreter_fingerprint(folder), "files": generated_files}, folder))
+    return candidates, failures
+
+
+class DirectoryArtifactCache(object):
+    """
+    Cache of built packages shared between machines: a folder (local or on a share) of zip archives, one per package
+    version, keyed by the fingerprint of the inputs it was built from
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+
+    def archive_path(self, family, version, key):
+        return os.path.join(self.folder, f"{family}-{version}-{key}.zip")
+
+    def fetch(self, family, version, key, package_folder, jobs=None):
+        """
+        Extract the archive of a package in its folder. The extraction goes to a staging folder renamed into place
+        when complete, replacing the previous content. Corrupt archives are removed from the cache
+        :return: True if the cache holds the package
+        """
+        archive_path = self.archive_path(family, version, key)
+        if not os.path.isfile(archive_path):
+            return False
+        staging_folder = f"{package_folder}.{os.getpid()}.partial"
+        rmtree(staging_folder, ignore_errors=True)
+        try:
+            extract_zip(archive_path, staging_folder, jobs)
+        except (OSError,) + _CORRUPT_PACK_ERRORS as e:
+            rmtree(staging_folder, ignore_errors=True)
+            if isinstance(e, _CORRUPT_PACK_ERRORS):
+                _remove_file(archive_path)  # corrupt: let the next build publish it again
+            raise
+        if os.path.isdir(package_folder):
+            rmtree(package_folder)
+        os.rename(staging_folder, package_folder)
+        return True
+
+    def publish(self, family, version, key, package_folder):
+        """
+        Archive a package folder in the cache, unless it already holds it. Several machines can publish the same
+        package at once: each writes its own temp file and the last rename wins
+        :return: True if the package was published
+        """
+        archive_path = self.archive_path(family, version, key)
+        if os.path.isfile(archive_path):
+            return False
+        os.makedirs(self.folder, exist_ok=True)
+        temp_path = f"{archive_path}.{socket.gethostname()}.{os.getpid()}.partial"
+        try:
+            with zipfile.ZipFile(temp_path, "w", zipfile.ZIP_DEFLATED, compresslevel=_DEFAULT_PACK_LEVEL) as archive:
+                for entry in sorted(walk_tree(package_folder)):
+                    arcname = os.path.relpath(entry.path, package_folder).replace(os.sep, "/")
+                    if arcname != _PACKAGE_STAMP:
+                        archive.write(entry.path, arcname)
+            os.replace(temp_path, archive_path)
+        except OSError:
+            _remove_file(temp_path)
+            raise
+        return True
+
+
+def rez_build_machine_packages(rez_bin_folder, python_interpreter_folder, bind_packages=_DEFAULT_BIND_PACKAGES,
+                               packages_folder=None, force=False, interpreters=(), artifacts=None, prefer_links=False):
+    """
+    Build some essential rez packages for the user's machine.
+    The commands don't depend on each other, so they run at the same time and each pays the rez startup cost in
+    parallel: making a python package for every interpreter costs about as much as the slowest one. Their output is
+    printed as it comes, every line prefixed with the command.
+    Every package is stamped with a fingerprint of its inputs: the interpreter tree and generated build files for
+    python, the platform values rez-bind detects for the others. Packages still installed with the same fingerprint
+    are up to date and skipped. With an artifact cache, the python packages are fetched from it when another machine
+    already built them from the same inputs, and published to it after being built.
+    :param rez_bin_folder: folder of the rez executables
+    :param python_interpreter_folder: WinPython folder, built as a python package
+    :param bind_packages: system packages to create with rez-bind
+    :param packages_folder: local packages folder, defaults to REZ_LOCAL_PACKAGES_PATH
+    :param force: run every command, even for up to date packages (and don't fetch them from the artifact cache)
+    :param interpreters: folders of other interpreters (e.g. shipped with DCCs) to build as python packages
+    :param artifacts: DirectoryArtifactCache shared between machines, None to build everything locally
+    :param prefer_links: build the python packages of interpreters on the volume of the packages folder instead of
+                         fetching them: the build hardlinks the interpreter, a fetched package is a copy of it
+    :return: True if every command succeeded
+    """
+    packages_folder = packages_folder or os.environ.get("REZ_LOCAL_PACKAGES_PATH")
+
+    # rez-build a python package for WinPython and every other interpreter, versioned after their headers
+    interpreters = [(python_interpreter_folder, _PYTHON_PACKAGE_VERSION)] + [(folder, None) for folder in interpreters]
+    build_folder = tempfile.mkdtemp(prefix="redrez_python_")
+    try:
+        return _build_machine_packages(rez_bin_folder, interpreters, build_folder, bind_packages, packages_folder,
+                                       force, artifacts, prefer_links)
+    finally:
+        rmtree(build_folder, ignore_errors=True)
+
+
+def _build_machine_packages(rez_bin_folder, interpreters, build_folder, bind_packages, packages_folder, force,
+                            artifacts, prefer_links):
+    """
+    Build the machine packages of rez_build_machine_packages, the python package definitions going to build_folder
+    """
+    candidates, unprepared = python_package_builds(rez_bin_folder, interpreters, build_folder)
+    failures = [(name, "could not be prepared") for name in unprepared]
 
     # rez-bind some packages
-    run([os.path.join(rez_bin_folder, "rez-bind"), "platform"])
-    run([os.path.join(rez_bin_folder, "rez-bind"), "arch"])
-    run([os.path.join(rez_bin_folder, "rez-bind"), "os"])
+    detected = {"system": platform.system(), "release": platform.release(), "version": platform.version(),
+                "machine": platform.machine()}
+    candidates.extend((f"rez-bind {package}", [os.path.join(rez_bin_folder, "rez-bind"), package], None,
+                       package, None, {"platform": detected}, None)
+                      for package in bind_packages)
+
+    commands = []
+    fingerprints = {}
+    linkable = set()
+    for name, args, cwd, family, version, inputs, source in candidates:
+        fingerprint = _fingerprint(dict(inputs, package=family, version=version))
+        if not force and packages_folder and read_package_stamp(packages_folder, family, version) == fingerprint and \
+                _package_installed(packages_folder, family, version):
+            print(f"[{name}] up to date, skipped")
+            continue
+        # Versioned packages are built from files (not detected on the machine), so other machines can reuse them
+        artifact = (family, version, fingerprint, os.path.join(packages_folder, family, version)) \
+            if packages_folder and version is not None else None
+        commands.append((name, args, cwd, artifact))
+        fingerprints[name] = (family, version, fingerprint)
+        # A local build hardlinking the interpreter costs a rez startup but no copy nor disk space: an archive
+        # fetched from the cache is extracted file by file
+        if prefer_links and source is not None and packages_folder and _same_volume(source, packages_folder):
+            linkable.add(name)
+    if not commands and not failures:
+        return True
+    total = len(commands) + len(unprepared)
+
+    def stamp(name):
+        family, version, fingerprint = fingerprints[name]
+        if packages_folder and os.path.isdir(os.path.join(packages_folder, family, version or "")):
+            write_package_stamp(packages_folder, family, version, fingerprint)
+
+    def fetch(command):
+        name, args, cwd, artifact = command
+        try:
+            return artifact is not None and name not in linkable and artifacts.fetch(*artifact)
+        except (OSError,) + _CORRUPT_PACK_ERRORS as e:
+            print(f"[{name}] could not fetch from the artifact cache: {e}")
+            return False
 
+    def publish(command):
+        name, args, cwd, artifact = command
+        try:
+            if artifacts.publish(*artifact):
+                print(f"[{name}] published to the artifact cache")
+        except OSError as e:
+            print(f"[{name}] could not publish to the artifact cache: {e}")
+
+    # Packages another machine already built from the same inputs are fetched instead of made
+    if artifacts is not None and not force and commands:
+        with ThreadPoolExecutor(max_workers=len(commands)) as pool:
+            fetched = list(pool.map(fetch, commands))
+        for (name, *_), was_fetched in zip(commands, fetched):
+            if was_fetched:
+                print(f"[{name}] fetched from the artifact cache")
+                stamp(name)
+        commands = [command for command, was_fetched in zip(commands, fetched) if not was_fetched]
+
+    results = _RUNNER.run([(name, args, cwd, _BUILD_COMMAND_TIMEOUT) for name, args, cwd, _ in commands])
+    published = []
+    for command, result in zip(commands, results):
+        if result.returncode != 0:
+            failures.append((result.name, result.error or f"exit code {result.returncode}"))
+            continue
+        stamp(result.name)
+        if artifacts is not None and command[3] is not None and os.path.isdir(command[3][3]):
+            published.append(command)
+    if published:
+        with ThreadPoolExecutor(max_workers=len(published)) as pool:
+            list(pool.map(publish, published))
+
+    if failures:
+        print(f"{len(failures)} of {total} machine packages failed:")
+        for name, reason in failures:
+            print(f"  {name}: {reason}")
+    return not failures
+
+
+def write_installation_log(utgtools_folder, local_folder, unit, install_folder, release_folder):
+    """
+    Write the installation_log.txt describing how this machine's installation is laid out
+    """
+    _remove_file(os.path.join(utgtools_folder, "installation_log.txt"))  # may be hardlinked to another slot
+    installation_log_file = open(os.path.join(utgtools_folder, "installation_log.txt"), "w+")
+    installation_log_file.write(f"local folder:{local_folder}\n"
+                                f"map unit:{unit.lower() if unit is not None else None}\n"
+                                f"install folder:{install_folder}\n"
+                                f"release folder:{release_folder}")
+    installation_log_file.close()
 
-def install_rez(local_folder, unit, release_folder, add_to_path):
+
+def read_installation_log(utgtools_folder):
+    """
+    Read the installation_log.txt written by install_rez
+    :return: dictionary of the logged values, empty if the log is missing
+    """
+    values = {}
+    try:
+        with open(os.path.join(utgtools_folder, "installation_log.txt"), "r") as installation_log_file:
+            for line in installation_log_file:
+                key, _, value = line.rstrip("\n").partition(":")
+                values[key] = value
+    except IOError:
+        pass
+    return values
+
+
+def create_rez_image(utgtools_folder, image_path):
+    """
+    Capture the rez folder built by install.py as a relocatable image, so other machines can skip install.py.
+    Machine-specific content (local packages and rezconfig.py) is left out.
+    :param utgtools_folder: core folder of an existing installation
+    :param image_path: path of the zip file to write
+    :return: number of captured files
+    """
+    rez_folder = os.path.join(utgtools_folder, "rez")
+    if not os.path.exists(os.path.join(rez_folder, "pyvenv.cfg")):
+        print(f"No rez installation found in {rez_folder}")
+        return 0
+
+    # Paths baked in the virtualenv are the ones used during the install, which may be a remapped unit
+    install_folder = read_installation_log(utgtools_folder).get("install folder")
+    captured_core_folder = os.path.join(install_folder, _CORE_DIR) if install_folder else utgtools_folder
+    python_zip = os.path.join(os.path.dirname(sys.argv[0]), _PORTABLE_PYTHON_ZIP)
+    metadata = {"core_folder": captured_core_folder,
+                "python_archive": file_digest(python_zip) if os.path.exists(python_zip) else None}
+
+    os.makedirs(os.path.dirname(os.path.abspath(image_path)), exist_ok=True)
+    captured_files = 0
+    with zipfile.ZipFile(image_path, 'w', zipfile.ZIP_DEFLATED) as image:
+        for root, dirs, files in os.walk(rez_folder):
+            if root == rez_folder:
+                dirs[:] = [folder for folder in dirs if folder not in _REZ_IMAGE_EXCLUDED]
+                files = [file for file in files if file not in _REZ_IMAGE_EXCLUDED]
+            for file in files:
+                file_path = os.path.join(root, file)
+                image.write(file_path, os.path.join("rez", os.path.relpath(file_path, rez_folder)))
+                captured_files += 1
+        image.writestr(_REZ_IMAGE_METADATA, json.dumps(metadata))
+    return captured_files
+
+
+def _relocatable_files(rez_folder):
+    """
+    Yield the files of a rez virtualenv that embed absolute interpreter paths: root files such as pyvenv.cfg,
+    launchers and activation scripts under Scripts, and .pth files in site-packages
+    """
+    for entry in os.scandir(rez_folder):
+        if entry.is_file():
+            yield entry.path
+    for root, dirs, files in os.walk(os.path.join(rez_folder, "Scripts")):
+        for file in files:
+            yield os.path.join(root, file)
+    site_packages_folder = os.path.join(rez_folder, "Lib", "site-packages")
+    if os.path.isdir(site_packages_folder):
+        for entry in os.scandir(site_packages_folder):
+            if entry.is_file() and entry.name.endswith((".pth", ".egg-link")):
+                yield entry.path
+
+
+def relocate_rez_image(rez_folder, captured_core_folder, core_folder):
+    """
+    Rewrite the interpreter and virtualenv paths embedded in a laid down rez image so they point to core_folder.
+    Launcher executables are patched too: their shebang sits before the appended zip, which uses relative offsets.
+    :return: number of patched files
+    """
+    old_paths = {captured_core_folder.rstrip("\\/"), captured_core_folder.rstrip("\\/").replace("\\", "/")}
+    new_path = os.path.abspath(core_folder).encode("utf-8")
+    pattern = re.compile(b"|".join(re.escape(path.encode("utf-8")) for path in sorted(old_paths, key=len, reverse=True)),
+                         re.IGNORECASE)
+
+    patched_files = 0
+    for file_path in _relocatable_files(rez_folder):
+        with open(file_path, "rb") as relocatable_file:
+            content = relocatable_file.read()
+        patched_content = pattern.sub(lambda match: new_path, content)
+        if patched_content != content:
+            _remove_file(file_path)
+            with open(file_path, "wb") as relocatable_file:
+                relocatable_file.write(patched_content)
+            patched_files += 1
+    return patched_files
+
+
+def install_rez_image(image_path, utgtools_folder, jobs=None):
+    """
+    Lay down a rez image created by create_rez_image and patch its paths for this installation
+    :param image_path: path of the image zip file
+    :param utgtools_folder: core folder of the installation
+    :param jobs: number of worker threads used for the extraction
+    :return: number of patched files
+    """
+    with zipfile.ZipFile(image_path, 'r') as image:
+        metadata = json.loads(image.read(_REZ_IMAGE_METADATA))
+    python_zip = os.path.join(os.path.dirname(sys.argv[0]), _PORTABLE_PYTHON_ZIP)
+    if metadata.get("python_archive") and metadata["python_archive"] != file_digest(python_zip):
+        print(f"Warning: {image_path} was captured with a different portable Python than {python_zip}")
+
+    extract_zip(image_path, utgtools_folder, jobs, incremental=True)
+    _remove_file(os.path.join(utgtools_folder, _REZ_IMAGE_METADATA))
+    return relocate_rez_image(os.path.join(utgtools_folder, "rez"), metadata["core_folder"], utgtools_folder)
+
+
+def compile_core(utgtools_folder, jobs=None, invalidation_mode="unchecked-hash"):
+    """
+    Precompile every .py file under the core folder, so the first rez-env on a machine doesn't pay for it.
+    The portable Python runs compileall with a process pool, so .pyc files match the interpreter that loads them.
+    With 'unchecked-hash' the interpreter doesn't stat sources at startup, so sources edited later are ignored until
+    the next compile.
+    :param utgtools_folder: core folder of the installation
+    :param jobs: number of worker processes, defaults to the number of cores
+    :param invalidation_mode: one of timestamp, checked-hash, unchecked-hash
+    :return: True if every file compiled
+    """
+    python_executable = os.path.join(utgtools_folder, "python", "python.exe")
+    result = _RUNNER.call("compileall", [python_executable, "-m", "compileall", "-q", "-j", str(jobs or 0),
+                                         "--invalidation-mode", invalidation_mode, "-x", _COMPILE_EXCLUDE,
+                                         utgtools_folder], timeout=_BUILD_COMMAND_TIMEOUT)
+    if result.returncode != 0:
+        print(f"Some files under {utgtools_folder} could not be compiled")
+        return False
+    return True
+
+
+def install_rez(local_folder, unit, release_folder, add_to_path, jobs=None, full=False,
+                cache_folder=_DEFAULT_CACHE_FOLDER, image_path=None, compile_mode=None,
+                bind_packages=_DEFAULT_BIND_PACKAGES, interpreters=(), artifact_folder=None, profile=False,
+                prefer_links=False):
     """
     Perform a rez installation on a machine.
     Installation will include a portable WinPython that will be used for 'rez' setup.
+    :param jobs: number of worker threads used to extract the archives
+    :param full: rewrite every file of the portable Python, even when an unchanged copy is already installed, and
+                 rebuild the machine packages even when they are up to date
+    :param cache_folder: machine-wide extraction cache. The portable Python is hardlinked from it and the rez installer
+                         runs from it. If None the portable Python is extracted in place and rez is extracted to a temp
+                         folder that is deleted afterwards
+    :param image_path: rez image created by create_rez_image. When given, it is laid down in place of running install.py
+    :param compile_mode: if given, precompile the installed tree with this pyc invalidation mode
+    :param bind_packages: system packages to create with rez-bind
+    :param interpreters: folders of other interpreters to build as python packages next to the WinPython one
+    :param artifact_folder: folder of a DirectoryArtifactCache shared between machines, to fetch the python packages
+                            from and publish them to
+    :param profile: also run every step under cProfile (see StepTimer.write_report)
+    :param prefer_links: build the python packages that can hardlink their interpreter instead of fetching them from
+                         the artifact folder (see rez_build_machine_packages)
+    :return: (core folder, True if every machine package was made), None if rez itself could not be installed
     """
 
-    install_folder, release_packages_path = setup_folder_structure(local_folder, unit, release_folder)  # Get install and release folders
+    timer = StepTimer(profile)
+    with timer.step("folder setup"):
+        install_folder, release_packages_path = setup_folder_structure(local_folder, unit, release_folder)  # Get install and release folders
     utgtools_folder = os.path.join(install_folder, _CORE_DIR)
-
-    # Unpack portable WinPython
-    print("Extracting portable Python...")
-    with zipfile.ZipFile(os.path.join(os.path.dirname(sys.argv[0]), _PORTABLE_PYTHON_ZIP), 'r') as zip_ref:
-        zip_ref.extractall(utgtools_folder)
     python_interpreter_folder = os.path.join(utgtools_folder, "python")
-
-    # Unpack rez
     temp_rez_folder = (os.path.join(utgtools_folder, "temp_rez"))
-    print("Extracting rez source...")
-    with zipfile.ZipFile(os.path.join(os.path.dirname(sys.argv[0]), _REZ_ZIP), 'r') as zip_ref:
-        zip_ref.extractall(temp_rez_folder)
     rez_folder = os.path.join(utgtools_folder, "rez")
 
-    # Run rez install.py using WinPython, to permanently link rez to this interpreter
-    print("Running rez install.py...")
-    run([os.path.join(python_interpreter_folder, "python.exe"), os.path.join(temp_rez_folder, "rez", "install.py"), "-v", os.path.join(utgtools_folder, "rez")])
+    # Unpack portable WinPython and rez source at the same time: they are independent and install.py needs both
+    print("Extracting portable Python and rez source...")
+    with ThreadPoolExecutor(max_workers=2) as stages:
+        if cache_folder is not None:
+            python_stage = stages.submit(timer.timed, "extract portable Python", install_from_cache,
+                                         os.path.join(os.path.dirname(sys.argv[0]), _PORTABLE_PYTHON_ZIP), utgtools_folder,
+                                         cache_folder, jobs, full)
+        else:
+            python_stage = stages.submit(timer.timed, "extract portable Python", extract_zip,
+                                         os.path.join(os.path.dirname(sys.argv[0]), _PORTABLE_PYTHON_ZIP), utgtools_folder,
+                                         jobs, incremental=not full)
+        if image_path is not None:
+            rez_stage = stages.submit(timer.timed, "lay down rez image", install_rez_image, image_path, utgtools_folder, jobs)
+        elif cache_folder is not None:
+            # rez install.py needs a real source tree (it pip-installs it), so it runs from the reusable cache
+            # instead of a temp folder written and deleted on every install
+            rez_stage = stages.submit(timer.timed, "extract rez source", cached_extract,
+                                      os.path.join(os.path.dirname(sys.argv[0]), _REZ_ZIP), cache_folder, jobs)
+        else:
+            rez_stage = stages.submit(timer.timed, "extract rez source", extract_zip,
+                                      os.path.join(os.path.dirname(sys.argv[0]), _REZ_ZIP), temp_rez_folder, jobs)
+        print(f"{python_stage.result()} portable Python files written")
+        if image_path is not None:
+            print(f"rez image laid down, {rez_stage.result()} files relocated")
+        else:
+            rez_source_folder = rez_stage.result() if cache_folder is not None else temp_rez_folder
+
+    if image_path is None:
+        # Run rez install.py using WinPython, to permanently link rez to this interpreter
+        print("Running rez install.py...")
+        with timer.step("rez install.py"):
+            result = _RUNNER.call("rez install.py", [os.path.join(python_interpreter_folder, "python.exe"),
+                                                     os.path.join(rez_source_folder, "rez", "install.py"), "-v",
+                                                     os.path.join(utgtools_folder, "rez")],
+                                  timeout=_BUILD_COMMAND_TIMEOUT)
+        if result.returncode != 0:
+            # Nothing that follows works without rez
+            print(f"rez install.py failed: {result.error or f'exit code {result.returncode}'}")
+            timer.report()
+            _RUNNER.report()
+            return None
 
     rez_bin_folder = os.path.join(rez_folder, "Scripts", "rez")
 
     # Add installed rez to user's Path env var
     if add_to_path:
-        add_rez_to_path(rez_bin_folder)
+        with timer.step("path"):
+            add_rez_to_path(rez_bin_folder)
 
     # Write rezconfig.py file
-    setup_rezconfig_file(os.path.join(rez_folder, 'packages'), release_packages_path)
+    with timer.step("rezconfig"):
+        setup_rezconfig_file(os.path.join(rez_folder, 'packages'), release_packages_path)
 
-    # rez-build WinPython package (default Python package used by rez) and bind machine packages (platform,arch,os)
-    rez_build_machine_packages(rez_bin_folder, python_interpreter_folder)
+    # rez-build the WinPython package (and the other interpreters) and bind machine packages (platform,arch,os)
+    with timer.step("build machine packages"):
+        packages_built = rez_build_machine_packages(rez_bin_folder, python_interpreter_folder, bind_packages,
+                                   os.path.join(rez_folder, "packages"), full, interpreters,
+                                   DirectoryArtifactCache(artifact_folder) if artifact_folder else None, prefer_links)
 
     # Remove temp folder
-    try:
-        rmtree(temp_rez_folder)
-    except OSError as e:
-        print(f"Error while removing {temp_rez_folder}:  {e.strerror}")
+    if cache_folder is None and image_path is None:
+        with timer.step("cleanup"):
+            try:
+                rmtree(temp_rez_folder)
+            except OSError as e:
+                print(f"Error while removing {temp_rez_folder}:  {e.strerror}")
+
+    # Precompile rez, the interpreter and the built packages
+    if compile_mode is not None:
+        print("Compiling Python files...")
+        with timer.step("compile"):
+            compile_core(utgtools_folder, jobs, compile_mode)
 
     # Create of a simple batch file for testing purpose inside install_folder
-    launchers_dir_fullpath = os.path.join(utgtools_folder, _LAUNCHERS_DIR)
-
-    if not os.path.exists(launchers_dir_fullpath):
-        os.makedirs(launchers_dir_fullpath)
-    test_rez_file = open(os.path.join(launchers_dir_fullpath, "test_rez.bat"), "w+")
-    """test_rez_file.write(#f"IF \"%REZ_CONFIG_FILE%\"==\"\" SET REZ_CONFIG_FILE={os.path.join(install_folder, _CORE_DIR, 'rez','rezconfig.py')}\n"
-                        f"{os.path.join(install_folder, _CORE_DIR, 'rez', 'Scripts', 'rez','rez-env')} python --"
-                        f" {os.path.join(install_folder, _CORE_DIR, 'rez', 'Scripts', 'rez','rez-context')}"
-                        f"\npause")"""
-    test_rez_file.write("rez-env python -- rez-context\npause")
-    test_rez_file.close()
-
-    os.environ["UTGTOOLS"] = utgtools_folder
-    run(["setx.exe", "UTGTOOLS", utgtools_folder])
+    with timer.step("launchers"):
+        launchers_dir_fullpath = os.path.join(utgtools_folder, _LAUNCHERS_DIR)
+
+        if not os.path.exists(launchers_dir_fullpath):
+            os.makedirs(launchers_dir_fullpath)
+        test_rez_file = open(os.path.join(launchers_dir_fullpath, "test_rez.bat"), "w+")
+        """test_rez_file.write(#f"IF \"%REZ_CONFIG_FILE%\"==\"\" SET REZ_CONFIG_FILE={os.path.join(install_folder, _CORE_DIR, 'rez','rezconfig.py')}\n"
+                            f"{os.path.join(install_folder, _CORE_DIR, 'rez', 'Scripts', 'rez','rez-env')} python --"
+                            f" {os.path.join(install_folder, _CORE_DIR, 'rez', 'Scripts', 'rez','rez-context')}"
+                            f"\npause")"""
+        test_rez_file.write("rez-env python -- rez-context\npause")
+        test_rez_file.close()
+
+    with timer.step("environment"):
+        os.environ["UTGTOOLS"] = utgtools_folder
+        _RUNNER.call("setx UTGTOOLS", ["setx.exe", "UTGTOOLS", utgtools_folder])
     print(f"\nUTGTOOLS env var set\n")
 
-    installation_log_file = open(os.path.join(utgtools_folder, "installation_log.txt"), "w+")
-    installation_log_file.write(f"local folder:{local_folder}\n"
-                                f"map unit:{unit.lower()}\n"
-                                f"install folder:{install_folder}\n"
-                                f"release folder:{release_folder}")
-    installation_log_file.close()
+    write_installation_log(utgtools_folder, local_folder, unit, install_folder, release_folder)
+
+    timer.report()
+    _RUNNER.report()
+    print(f"Profile written to {timer.write_report(os.path.join(utgtools_folder, _PROFILE_REPORT), _RUNNER.results)}")
+    return utgtools_folder, packages_built
+
+
+class ZipSplicer(object):
+    """
+    Write a zip file out of members that were already compressed elsewhere, e.g. by worker processes.
+    Offsets are tracked here instead of asking the output, so the output never needs to be seekable.
+    ZIP64 records are written when sizes, offsets or the member count don't fit the classic format.
+    """
+
+    def __init__(self, output):
+        self.output = output
+        self.offset = 0
+        self._central_directory = []
+
+    def _write(self, data):
+        self.output.write(data)
+        self.offset += len(data)
+
+    @staticmethod
+    def _member_fields(arcname, mtime):
+        """
+        Return encoded name, flags, DOS time and DOS date of a member
+        """
+        name = arcname.replace(os.sep, "/").encode("utf-8")
+        flags = 0x800 if not arcname.isascii() else 0  # utf-8 names
+        date_time = time.localtime(mtime)[:6] if mtime >= 315532800 else (1980, 1, 1, 0, 0, 0)
+        dos_time = date_time[3] << 11 | date_time[4] << 5 | date_time[5] // 2
+        dos_date = (date_time[0] - 1980) << 9 | date_time[1] << 5 | date_time[2]
+        return name, flags, dos_time, dos_date
+
+    def write_member(self, arcname, mtime, mode, compress_type, crc, file_size, data):
+        """
+        Write a member whose data is already compressed with compress_type
+        :param arcname: name of the member inside the zip
+        :param mtime: modification time of the member, as a timestamp
+        :param mode: st_mode of the original file
+        :param compress_type: zipfile.ZIP_STORED or zipfile.ZIP_DEFLATED
+        :param crc: CRC32 of the uncompressed data
+        :param file_size: size of the uncompressed data
+        :param data: member data, compressed with compress_type
+        """
+        name, flags, dos_time, dos_date = self._member_fields(arcname, mtime)
+        header_offset = self.offset
+        zip64 = file_size >= 0xFFFFFFFF or len(data) >= 0xFFFFFFFF
+        version = 45 if zip64 else 20
+
+        extra = struct.pack("<HHQQ", 1, 16, file_size, len(data)) if zip64 else b""
+        self._write(struct.pack("<4s5H3L2H", b"PK\x03\x04", version, flags, compress_type, dos_time, dos_date, crc,
+                                0xFFFFFFFF if zip64 else len(data), 0xFFFFFFFF if zip64 else file_size,
+                                len(name), len(extra)) + name + extra)
+        self._write(data)
+        self._central_directory.append((name, version, flags, compress_type, dos_time, dos_date, crc, len(data),
+                                        file_size, header_offset, mode))
+
+    def write_streamed_member(self, arcname, mtime, mode, file_path, level):
+        """
+        Deflate a file chunk by chunk straight into the output. CRC32 and sizes follow the data in a data descriptor,
+        so memory use doesn't depend on the file size and nothing has to be patched back in the header.
+        :param arcname: name of the member inside the zip
+        :param mtime: modification time of the member, as a timestamp
+        :param mode: st_mode of the original file
+        :param file_path: file to deflate
+        :param level: zlib compression level
+        :return: (CRC32, file size, SHA-256) of the file
+        """
+        name, flags, dos_time, dos_date = self._member_fields(arcname, mtime)
+        flags |= 0x08  # sizes and CRC32 in a data descriptor
+        header_offset = self.offset
+        zip64 = os.path.getsize(file_path) >= 0xFFFF0000  # leave room for deflate overhead
+        version = 45 if zip64 else 20
+        extra = struct.pack("<HHQQ", 1, 16, 0, 0) if zip64 else b""
+        self._write(struct.pack("<4s5H3L2H", b"PK\x03\x04", version, flags, zipfile.ZIP_DEFLATED, dos_time, dos_date, 0,
+                                0xFFFFFFFF if zip64 else 0, 0xFFFFFFFF if zip64 else 0, len(name), len(extra)) + name + extra)
+
+        data_offset = self.offset
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+        digest = hashlib.sha256()
+        crc = 0
+        file_size = 0
+        with open(file_path, "rb") as source:
+            for chunk in iter(lambda: source.read(_EXTRACT_BUFFER_SIZE), b""):
+                crc = zlib.crc32(chunk, crc)
+                digest.update(chunk)
+                file_size += len(chunk)
+                self._write(compressor.compress(chunk))
+        self._write(compressor.flush())
+        compress_size = self.offset - data_offset
+
+        self._write(struct.pack("<4sLQQ" if zip64 else "<4s3L", b"PK\x07\x08", crc, compress_size, file_size))
+        self._central_directory.append((name, version, flags, zipfile.ZIP_DEFLATED, dos_time, dos_date, crc,
+                                        compress_size, file_size, header_offset, mode))
+        return crc, file_size, digest.hexdigest()
+
+    def close(self, comment=b""):
+        """
+        Write the central directory and the end of central directory records
+        """
+        directory_offset = self.offset
+        for name, version, flags, compress_type, dos_time, dos_date, crc, compress_size, file_size, header_offset, mode \
+                in self._central_directory:
+            zip64_fields = [value for value in (file_size, compress_size, header_offset) if value >= 0xFFFFFFFF]
+            extra = struct.pack(f"<HH{len(zip64_fields)}Q", 1, 8 * len(zip64_fields), *zip64_fields) if zip64_fields else b""
+            self._write(struct.pack("<4s6H3L5H2L", b"PK\x01\x02", version, version, flags, compress_type, dos_time,
+                                    dos_date, crc, min(compress_size, 0xFFFFFFFF), min(file_size, 0xFFFFFFFF),
+                                    len(name), len(extra), 0, 0, 0, (mode & 0xFFFF) << 16,
+                                    min(header_offset, 0xFFFFFFFF)) + name + extra)
+        directory_size = self.offset - directory_offset
+        entries = len(self._central_directory)
+
+        if entries >= 0xFFFF or directory_offset >= 0xFFFFFFFF or directory_size >= 0xFFFFFFFF:
+            zip64_record_offset = self.offset
+            self._write(struct.pack("<4sQ2H2L4Q", b"PK\x06\x06", 44, 45, 45, 0, 0, entries, entries,
+                                    directory_size, directory_offset))
+            self._write(struct.pack("<4sLQL", b"PK\x06\x07", 0, zip64_record_offset, 1))
+        self._write(struct.pack("<4s4H2LH", b"PK\x05\x06", 0, 0, min(entries, 0xFFFF), min(entries, 0xFFFF),
+                                min(directory_size, 0xFFFFFFFF), min(directory_offset, 0xFFFFFFFF), len(comment)) + comment)
+        self.output.flush()
+
+
+def choose_compression(file_path, file_size, level, adaptive=True):
+    """
+    Pick the compression of a pack member from how well a sample of the file deflates at the fastest level.
+    Already compressed data (wheels, nested zips, packed binaries) is stored, moderately compressible data gets the
+    fast level and the rest gets the pack level. Files smaller than a sample go straight to the pack level.
+    :param file_path: file to sample
+    :param file_size: size of the file
+    :param level: zlib compression level of the pack, 0 stores every file
+    :param adaptive: sample the file, otherwise every file gets the pack level
+    :return: (decision, zlib level) where decision is stored, fast or high and the level is 0 for stored
+    """
+    if not level:
+        return "stored", 0
+    if not adaptive or file_size <= _PACK_SAMPLE_SIZE:
+        return "high", level
+    with open(file_path, "rb") as source:
+        sample = source.read(_PACK_SAMPLE_SIZE // 2)
+        source.seek(file_size // 2)
+        sample += source.read(_PACK_SAMPLE_SIZE // 2)
+    ratio = len(zlib.compress(sample, 1)) / len(sample)
+    if ratio >= _INCOMPRESSIBLE_RATIO:
+        return "stored", 0
+    if ratio >= _FAST_DEFLATE_RATIO:
+        return "fast", min(level, 1)
+    return "high", level
+
+
+def _compress_files(batch, level, adaptive=True):
+    """
+    Read and deflate a batch of files. Runs in a worker process of zip_utgtools.
+    A file is stored instead when deflating doesn't make it smaller.
+    :param batch: list of (file path, file size) tuples
+    :param level: zlib compression level, 0 stores every file
+    :param adaptive: let choose_compression pick the level of every file
+    :return: list of (compress type, CRC32, file size, SHA-256, data, decision) tuples
+    """
+    results = []
+    for file_path, walked_size in batch:
+        decision, file_level = choose_compression(file_path, walked_size, level, adaptive)
+        compressor = zlib.compressobj(file_level, zlib.DEFLATED, -15)
+        digest = hashlib.sha256()
+        crc = 0
+        file_size = 0
+        chunks = []
+        with open(file_path, "rb") as source:
+            for chunk in iter(lambda: source.read(_EXTRACT_BUFFER_SIZE), b""):
+                crc = zlib.crc32(chunk, crc)
+                digest.update(chunk)
+                file_size += len(chunk)
+                chunks.append(compressor.compress(chunk) if file_level else chunk)
+        if file_level:
+            chunks.append(compressor.flush())
+        data = b"".join(chunks)
+        if file_level and len(data) >= file_size:
+            with open(file_path, "rb") as source:
+                data = source.read()
+            decision, file_level = "stored", 0
+        results.append((zipfile.ZIP_DEFLATED if file_level else zipfile.ZIP_STORED, crc, file_size,
+                        digest.hexdigest(), data, decision))
+    return results
+
+
+def _hash_files(file_paths, jobs):
+    """
+    Hash files with a pool of worker threads
+    :return: dictionary of file path -> SHA-256 hex digest
+    """
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        return dict(zip(file_paths, pool.map(file_digest, file_paths)))
+
+
+def manifest_digest(files):
+    """
+    Return a digest identifying the tree described by a manifest's files, regardless of how the pack stores them
+    """
+    state = {path: [entry["size"], entry["sha256"]] for path, entry in files.items()}
+    return hashlib.sha256(json.dumps(state, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def load_manifest(manifest_path):
+    """
+    Load a pack manifest from a manifest file, or from the pack itself
+    :return: dictionary with at least the "files" key
+    """
+    if zipfile.is_zipfile(manifest_path):
+        with zipfile.ZipFile(manifest_path, 'r') as zip_ref:
+            return json.loads(zip_ref.read(_PACK_MANIFEST))
+    with open(manifest_path, "r") as manifest_file:
+        return json.load(manifest_file)
+
+
+def write_manifest(manifest_path, manifest):
+    """
+    Atomically write a manifest file
+    """
+    temp_path = manifest_path + ".tmp"
+    with open(temp_path, "w") as manifest_file:
+        json.dump(manifest, manifest_file, sort_keys=True)
+    os.replace(temp_path, manifest_path)
+
+
+def _content_groups(files, jobs):
+    """
+    Group (path, arcname, TreeEntry) records by content. Only files sharing their size with another file can be duplicates,
+    so only those are hashed up front.
+    :return: list of groups, each a list of records with identical content
+    """
+    by_size = {}
+    for record in files:
+        by_size.setdefault(record[2].size, []).append(record)
+    digests = _hash_files([record[0] for records in by_size.values() if len(records) > 1 for record in records], jobs)
 
-    return utgtools_folder
+    groups = {}
+    for record in files:
+        groups.setdefault(digests.get(record[0], record[0]), []).append(record)
+    return list(groups.values())
 
 
-def zip_utgtools(utgtools_folder):
-    # Zip installed rez, ready for redistributing
+def _pack_batches(groups):
+    """
+    Put groups of identical (path, arcname, TreeEntry) records in batches for the compression workers: small files travel
+    together to amortise the inter-process overhead, big files go alone and very big ones are left to the splicer
+    """
+    batch = []
+    batch_size = 0
+    for group in groups:
+        if group[0][2].size >= _PACK_STREAMED_MEMBER_SIZE:
+            # Streamed by the splicer itself, so it goes alone
+            if batch:
+                yield batch
+            yield [group]
+            batch = []
+            batch_size = 0
+            continue
+        batch.append(group)
+        batch_size += group[0][2].size
+        if batch_size >= _PACK_BATCH_SIZE or len(batch) >= _PACK_BATCH_FILES:
+            yield batch
+            batch = []
+            batch_size = 0
+    if batch:
+        yield batch
+
+
+def is_pack_stream(pack_path):
+    """
+    Tell whether a pack path designates a stream rather than a file
+    """
+    return pack_path == "-" or pack_path.startswith("tcp://")
+
 
-    if not os.path.exists(os.path.join(utgtools_folder, "redist")):
-        os.makedirs(os.path.join(utgtools_folder, "redist"))
+@contextmanager
+def open_pack_stream(pack_path, mode):
+    """
+    Open a pack for sequential reading ('rb') or writing ('wb').
+    '-' is the standard input or output. 'tcp://host:port' connects to host when writing, and listens on the address
+    for a single connection when reading. Any other value is a file path.
+    """
+    if pack_path == "-":
+        stream = sys.__stdout__.buffer if mode == "wb" else sys.__stdin__.buffer
+        yield stream
+        if mode == "wb":
+            stream.flush()
+    elif pack_path.startswith("tcp://"):
+        host, _, port = pack_path[len("tcp://"):].rpartition(":")
+        if mode == "wb":
+            connection = socket.create_connection((host, int(port)))
+        else:
+            family, kind, protocol, _, address = socket.getaddrinfo(host or None, int(port), type=socket.SOCK_STREAM,
+                                                                    flags=socket.AI_PASSIVE)[0]
+            with socket.socket(family, kind, protocol) as server:  # socket.create_server needs Python 3.8
+                if os.name != "nt":  # on Windows it would let another process steal the port
+                    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                server.bind(address)
+                server.listen(1)
+                print(f"Waiting for a pack on port {port}...")
+                connection, address = server.accept()
+        with connection, connection.makefile(mode) as stream:
+            yield stream
+            if mode == "wb":
+                stream.flush()
+                connection.shutdown(socket.SHUT_WR)
+    else:
+        with open(pack_path, mode) as stream:
+            yield stream
+
+
+def pack_subtree(arcname):
+    """
+    Tell which rez package a pack path belongs to
+    :return: (family, version), None for the paths outside the packages folder
+    """
+    parts = arcname.split("/")
+    if len(parts) > len(_PACKAGES_PATH) + 2 and tuple(parts[:len(_PACKAGES_PATH)]) == _PACKAGES_PATH:
+        return parts[len(_PACKAGES_PATH)], parts[len(_PACKAGES_PATH) + 1]
+    return None
 
-    red_rez_zip = zipfile.ZipFile(os.path.join(utgtools_folder, "redist",'RedistributableRez.zip'), 'w', zipfile.ZIP_STORED)
+
+def _add_range(ranges, start, end):
+    """
+    Add a byte range to a list of ranges, merging it with the last one when they are contiguous
+    """
+    if ranges and ranges[-1][1] == start:
+        ranges[-1][1] = end
+    elif not ranges or ranges[-1] != [start, end]:
+        ranges.append([start, end])
+
+
+def zip_utgtools(utgtools_folder, pack_path=None, level=_DEFAULT_PACK_LEVEL, jobs=None, dedupe=False, since=None,
+                 adaptive=True, profile=False):
+    """
+    Zip installed rez, ready for redistributing.
+    Members are compressed concurrently by worker processes and spliced, in order, into a single zip file. The number
+    of batches in flight is bounded, so memory use doesn't grow with the size of the core folder.
+    The pack ends with a manifest mapping every packed path to its size, SHA-256 and the member holding its content,
+    also written next to the pack as <pack name>.manifest.json. It also records the core folder rez was installed in.
+    A deduplicated pack stores every distinct content once, as a blobs/<SHA-256> member shared by all its paths.
+    A delta pack only holds the files added or changed since a previous manifest: the others are listed without a
+    member, and the manifest records the digest of the base tree and the deleted paths.
+    Files are packed in path order, so the members of every rez package version are contiguous. A stored index member
+    maps each of them, the rest of the core folder and the manifest to byte ranges, and the zip comment locates it:
+    a partial deploy reads the index then only the ranges it needs (see unpack_subtrees).
+    :param utgtools_folder: folder holding the core folder
+    :param pack_path: path of the zip file, defaults to redist/RedistributableRez.zip inside utgtools_folder. It can also
+                      be a stream (see open_pack_stream): the pack is then written as it is produced, and its manifest
+                      goes to the default location
+    :param level: zlib compression level, 0 stores members uncompressed
+    :param jobs: number of compression processes, defaults to the number of cores
+    :param dedupe: store identical files once
+    :param since: manifest (or pack) of the previous version, to create a delta pack
+    :param adaptive: store incompressible files and use a fast level on poorly compressible ones (see choose_compression)
+    :param profile: also run every step under cProfile. The step report goes next to the manifest, as
+                    <pack name>.profile.json (see StepTimer.write_report)
+    :return: dictionary of pack statistics
+    """
+    timer = StepTimer(profile)
+    default_pack_path = os.path.join(utgtools_folder, "redist", _DEFAULT_PACK_NAME)
+    pack_path = pack_path or default_pack_path
+    streamed = is_pack_stream(pack_path)
+    os.makedirs(os.path.dirname(os.path.abspath(default_pack_path if streamed else pack_path)), exist_ok=True)
 
     core_folder = os.path.join(utgtools_folder, _CORE_DIR)
     zip_root_folder = os.path.basename(core_folder)
-    for root, dirs, files in os.walk(core_folder):
-        for file in files:
-            file_path = os.path.join(root, file)
-            parent_path = os.path.relpath(file_path, core_folder)
-            arcname = os.path.join(zip_root_folder, parent_path)
-            red_rez_zip.write(file_path, arcname)
-    red_rez_zip.close()
+    # Core folder the rez virtualenv was installed in, possibly through a remapped unit, for relocating it on deploy
+    install_folder = read_installation_log(core_folder).get("install folder")
+    origin = os.path.join(install_folder, _CORE_DIR) if install_folder else os.path.abspath(core_folder)
+
+    jobs = jobs or _DEFAULT_JOBS
+    files = []
+    with timer.step("walk"):
+        for entry in walk_tree(core_folder, jobs):
+            parent_path = os.path.relpath(entry.path, core_folder)
+            # Machine-specific files describing this installation, not the tree
+            if parent_path == _INSTALLED_MANIFEST or parent_path.split(os.sep)[0] in _PROFILE_FILES:
+                continue
+            files.append((entry.path, os.path.join(zip_root_folder, parent_path).replace(os.sep, "/"), entry))
+        files.sort(key=lambda record: record[1])
+
+    started = time.perf_counter()
+    manifest = {}
+    packed_files = files
+    delta = {}
+    if since is not None:
+        with timer.step("delta"):
+            # Files whose size changed are packed for sure, the others are compared by content
+            base_files = load_manifest(since)["files"]
+            same_size = [record for record in files
+                         if record[1] in base_files and base_files[record[1]]["size"] == record[2].size]
+            digests = _hash_files([record[0] for record in same_size], jobs)
+            for file_path, arcname, file_stat in same_size:
+                if digests[file_path] == base_files[arcname]["sha256"]:
+                    manifest[arcname] = {"size": file_stat.size, "sha256": digests[file_path], "blob": None}
+            packed_files = [record for record in files if record[1] not in manifest]
+            delta = {"base": manifest_digest(base_files),
+                     "deleted": sorted(base_files.keys() - {record[1] for record in files})}
+    if dedupe:
+        groups = timer.timed("dedupe", _content_groups, packed_files, jobs)
+    else:
+        groups = [[record] for record in packed_files]
+    bytes_in = 0
+    decisions = {}  # compression decision -> [members, bytes in, bytes out]
+    subtree_ranges = {}  # pack_subtree result -> byte ranges of its members
+    temp_path = pack_path + ".partial"
+    with timer.step("compress"), ProcessPoolExecutor(max_workers=jobs) as pool, \
+            open_pack_stream(pack_path if streamed else temp_path, "wb") as output:
+        splicer = ZipSplicer(output)
+        in_flight = deque()
+
+        def splice_oldest_batch():
+            batch, future = in_flight.popleft()
+            batch_start = splicer.offset
+            if future is None:
+                file_path, arcname, file_stat = batch[0][0]
+                blob = f"{_PACK_BLOBS_DIR}/{file_digest(file_path)}" if dedupe else arcname
+                decision, file_level = choose_compression(file_path, file_stat.size, level, adaptive)
+                member_offset = splicer.offset
+                crc, file_size, sha256 = splicer.write_streamed_member(blob, file_stat.mtime, file_stat.mode,
+                                                                       file_path, file_level)
+                results = [(blob, file_size, sha256, decision, splicer.offset - member_offset)]
+            else:
+                results = []
+                for group, (compress_type, crc, file_size, sha256, data, decision) in zip(batch, future.result()):
+                    file_path, arcname, file_stat = group[0]
+                    blob = f"{_PACK_BLOBS_DIR}/{sha256}" if dedupe else arcname
+                    member_offset = splicer.offset
+                    splicer.write_member(blob, file_stat.mtime, file_stat.mode, compress_type, crc, file_size, data)
+                    results.append((blob, file_size, sha256, decision, splicer.offset - member_offset))
+
+            spliced_bytes = 0
+            member_start = batch_start
+            for group, (blob, file_size, sha256, decision, member_size) in zip(batch, results):
+                for record in group:
+                    manifest[record[1]] = {"size": file_size, "sha256": sha256, "blob": blob}
+                spliced_bytes += file_size * len(group)
+                decision_stats = decisions.setdefault(decision, [0, 0, 0])
+                decision_stats[0] += 1
+                decision_stats[1] += file_size
+                decision_stats[2] += member_size
+                member_end = member_start + member_size
+                member_start = member_end
+                for subtree in {pack_subtree(record[1]) for record in group}:
+                    _add_range(subtree_ranges.setdefault(subtree, []), member_end - member_size, member_end)
+            return spliced_bytes
+
+        for batch in _pack_batches(groups):
+            if batch[0][0][2].size >= _PACK_STREAMED_MEMBER_SIZE:
+                in_flight.append((batch, None))
+            else:
+                in_flight.append((batch, pool.submit(_compress_files, [(group[0][0], group[0][2].size) for group in batch],
+                                                    level, adaptive)))
+            if len(in_flight) >= jobs * 2:
+                # Splice the oldest batch while the workers keep compressing the following ones
+                bytes_in += splice_oldest_batch()
+        while in_flight:
+            bytes_in += splice_oldest_batch()
+
+        manifest_data = json.dumps(dict(delta, files=manifest, origin=origin), sort_keys=True).encode("utf-8")
+        manifest_start = splicer.offset
+        splicer.write_member(_PACK_MANIFEST, time.time(), 0o100644, zipfile.ZIP_DEFLATED, zlib.crc32(manifest_data),
+                             len(manifest_data), zlib.compress(manifest_data, level)[2:-4])
+        index = {"base": subtree_ranges.pop(None, []), "manifest": [manifest_start, splicer.offset], "packages": {}}
+        for (family, version), ranges in subtree_ranges.items():
+            index["packages"].setdefault(family, {})[version] = ranges
+        index_data = json.dumps(index, sort_keys=True).encode("utf-8")
+        splicer.write_member(_PACK_INDEX, time.time(), 0o100644, zipfile.ZIP_STORED, zlib.crc32(index_data),
+                             len(index_data), index_data)
+        splicer.close(b"%s %d %d" % (_PACK_INDEX_COMMENT, splicer.offset - len(index_data), len(index_data)))
+        bytes_out = splicer.offset
+    if not streamed:
+        os.replace(temp_path, pack_path)
+    pack_base_path = os.path.splitext(default_pack_path if streamed else pack_path)[0]
+    with timer.step("manifest"):
+        write_manifest(pack_base_path + ".manifest.json", dict(delta, files=manifest, origin=origin))
+
+    elapsed = time.perf_counter() - started
+    stats = {"pack": pack_path, "files": len(packed_files), "blobs": len(groups), "bytes_in": bytes_in,
+             "bytes_out": bytes_out, "seconds": elapsed, "decisions": decisions}
+    print(f"Packed {len(packed_files)} files in {elapsed:.2f}s: {bytes_in / 1e6:.1f} MB -> {bytes_out / 1e6:.1f} MB "
+          f"(ratio {bytes_out / bytes_in if bytes_in else 1:.3f}, {bytes_in / 1e6 / elapsed if elapsed else 0:.1f} MB/s)")
+    for decision in ("stored", "fast", "high"):
+        if decision in decisions:
+            members, decision_in, decision_out = decisions[decision]
+            print(f"  {decision:<6} {members:8} members {decision_in / 1e6:10.1f} MB -> {decision_out / 1e6:10.1f} MB")
+    if dedupe:
+        print(f"{len(groups)} distinct contents stored for {len(packed_files)} files")
+    if since is not None:
+        print(f"Delta since {since}: {len(packed_files)} added or changed, {len(delta['deleted'])} deleted, "
+              f"{len(files) - len(packed_files)} unchanged")
+    timer.report()
+    stats["profile"] = timer.write_report(pack_base_path + ".profile.json")
+    return stats
+
+
+def read_pack_manifest(zip_ref):
+    """
+    Read the manifest of an open pack
+    :return: the manifest dictionary, None for packs without a manifest
+    """
+    try:
+        return json.loads(zip_ref.read(_PACK_MANIFEST))
+    except KeyError:
+        return None
+
+
+def pack_identity(manifest):
+    """
+    Identify the pack a manifest belongs to, as recorded in the first line of a DeployJournal
+    """
+    return hashlib.sha256(json.dumps(manifest, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def read_pack_identity(pack_path):
+    """
+    Identify a pack file without unpacking it (see pack_identity)
+    :return: the pack identity, None if the pack has no manifest or can't be read
+    """
+    try:
+        with zipfile.ZipFile(pack_path, 'r') as zip_ref:
+            manifest = read_pack_manifest(zip_ref)
+    except (OSError, ValueError) + _CORRUPT_PACK_ERRORS:
+        return None
+    return pack_identity(manifest) if manifest is not None else None
+
+
+def _installed_files_for(manifest, utgtools_folder):
+    """
+    Return the files of the manifest saved by the previous deploy in utgtools_folder, or None if there isn't one.
+    Raise ValueError if manifest belongs to a delta pack whose base version is not the deployed one.
+    """
+    try:
+        installed_files = load_manifest(os.path.join(utgtools_folder, _CORE_DIR, _INSTALLED_MANIFEST))["files"]
+    except (IOError, ValueError, KeyError):
+        installed_files = None
+    if "base" in manifest and (installed_files is None or manifest_digest(installed_files) != manifest["base"]):
+        raise ValueError(f"this is a delta pack and {utgtools_folder} doesn't hold its base version")
+    return installed_files
+
+
+def _blob_targets(manifest, utgtools_folder):
+    """
+    Map every member of a pack to the paths that receive its content, creating their folders
+    """
+    targets = {}
+    for path, entry in manifest["files"].items():
+        if entry["blob"] is not None:
+            targets.setdefault(entry["blob"], []).append(_member_target_path(utgtools_folder, path))
+    for folder in sorted({os.path.dirname(path) for paths in targets.values() for path in paths}):
+        os.makedirs(folder, exist_ok=True)
+    return targets
+
+
+def _link_copies(first_path, other_paths):
+    """
+    Make other_paths hardlinks of first_path, or copies where linking is not possible
+    """
+    for path in other_paths:
+        _remove_file(path)
+        try:
+            os.link(first_path, path)
+        except OSError:
+            shutil.copy2(first_path, path)
+
+
+def _finish_unpack(manifest, installed_files, utgtools_folder):
+    """
+    Remove the files that are not part of the unpacked version anymore and save its manifest in the core folder
+    """
+    for path in set(manifest.get("deleted", [])) | ((installed_files or {}).keys() - manifest["files"].keys()):
+        _remove_file(_member_target_path(utgtools_folder, path))
+    write_manifest(os.path.join(utgtools_folder, _CORE_DIR, _INSTALLED_MANIFEST),
+                   {"files": {path: {"size": entry["size"], "sha256": entry["sha256"]}
+                              for path, entry in manifest["files"].items()},
+                    "origin": manifest.get("origin")})
+
+
+def _merge_ranges(ranges):
+    """
+    Merge overlapping byte ranges, e.g. those of a deduplicated member shared by several subtrees, so every byte is
+    read once. Ranges hold whole members, and so do their unions; contiguous ranges are kept apart to be read at once
+    :return: sorted list of [start, end] ranges
+    """
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start < merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def read_pack_index(pack_file):
+    """
+    Read the index of a pack from its zip comment, without going through the central directory
+    :param pack_file: binary file object of the pack, seekable
+    :return: the index dictionary, None for packs without an index
+    """
+    pack_file.seek(0, os.SEEK_END)
+    tail_size = min(pack_file.tell(), 22 + 64)  # end of central directory record and a short comment
+    pack_file.seek(-tail_size, os.SEEK_END)
+    tail = pack_file.read(tail_size)
+    position = tail.rfind(b"PK\x05\x06")
+    comment = tail[position + 22:] if position >= 0 else b""
+    if not comment.startswith(_PACK_INDEX_COMMENT + b" "):
+        return None
+    offset, size = (int(value) for value in comment.split()[1:3])
+    pack_file.seek(offset)
+    return json.loads(pack_file.read(size))
+
+
+def select_subtrees(index, only):
+    """
+    Resolve package requests against a pack index. A request is a family (every packed version of it) or
+    family-version, the version matching itself and its sub-versions as in rez (blender-2.83 matches 2.83.4).
+    Raise ValueError for requests that match nothing.
+    :param index: pack index
+    :param only: list of package requests
+    :return: set of (family, version) tuples
+    """
+    selected = set()
+    for request in only:
+        family, _, version = request.partition("-")
+        versions = [packed_version for packed_version in index["packages"].get(family, {})
+                    if not version or packed_version == version or packed_version.startswith(version + ".")]
+        if not versions:
+            raise ValueError(f"no package matching {request} in the pack")
+        selected.update((family, packed_version) for packed_version in versions)
+    return selected
+
+
+class _RangeReader(object):
+    """
+    File reader confined to a byte range
+    """
+
+    def __init__(self, pack_path, start, end):
+        self._file = open(pack_path, "rb")
+        self._file.seek(start)
+        self._remaining = end - start
+
+    def read(self, size):
+        data = self._file.read(min(size, self._remaining))
+        if not data and self._remaining and size:
+            raise zipfile.BadZipFile("Unexpected end of pack file")
+        self._remaining -= len(data)
+        return data
+
+    def close(self):
+        self._file.close()
+
+
+def _place_staged_blobs(manifest, staging_folder, utgtools_folder, digests):
+    """
+    Move the members of a pack unpacked in a staging folder to their paths, linking or copying them to the other
+    paths sharing their content. Nothing is placed unless every member matches the SHA-256 of the manifest.
+    :param digests: member name -> SHA-256 computed while the member was staged
+    :return: number of files placed
+    """
+    for path, entry in manifest["files"].items():
+        if entry["blob"] is not None and digests.get(entry["blob"]) != entry["sha256"]:
+            raise zipfile.BadZipFile(f"Bad SHA-256 for {path}")
+    placed_files = 0
+    for blob, (first_path, *other_paths) in _blob_targets(manifest, utgtools_folder).items():
+        os.replace(_member_target_path(staging_folder, blob), first_path)
+        _link_copies(first_path, other_paths)
+        placed_files += 1 + len(other_paths)
+    return placed_files
+
+
+def unpack_subtrees(pack_path, utgtools_folder, only, jobs=None):
+    """
+    Deploy the core folder of a pack with only some of its rez packages. The pack index tells which byte ranges hold
+    the selected packages, the rest of the core folder and the manifest: only those are read, concurrently, into a
+    staging folder. The other packages are left out, and removed if a previous deploy installed them.
+    Delta packs are refused: their base check needs the complete version.
+    :param pack_path: path of the pack
+    :param utgtools_folder: folder receiving the core folder
+    :param only: list of package requests (see select_subtrees)
+    :param jobs: number of ranges read at once, defaults to the number of cores
+    :return: number of files written, None if the pack can't be applied
+    """
+    with open(pack_path, "rb") as pack_file:
+        index = read_pack_index(pack_file)
+    if index is None:
+        print(f"Can't deploy part of {pack_path}: it has no index, pack it again")
+        return None
+    try:
+        selected = select_subtrees(index, only)
+    except ValueError as e:
+        print(f"Can't deploy part of {pack_path}: {e}")
+        return None
+    ranges = [index["manifest"]] + index["base"]
+    for family, version in sorted(selected):
+        ranges.extend(index["packages"][family][version])
+    ranges = _merge_ranges(ranges)
+
+    staging_folder = os.path.join(utgtools_folder, _STREAM_STAGING_DIR)
+    rmtree(staging_folder, ignore_errors=True)
+
+    def unpack_range(byte_range):
+        range_reader = _RangeReader(pack_path, *byte_range)
+        try:
+            reader = _StreamReader(range_reader)
+            members = []
+            for signature in iter(reader.read_signature, b""):  # ranges end with their last member
+                if signature != b"PK\x03\x04":
+                    raise zipfile.BadZipFile(f"Unexpected data in the pack at offset {byte_range[0]}")
+                members.append(_read_stream_member(reader, staging_folder))
+            return members
+        finally:
+            range_reader.close()
+
+    try:
+        digests = {}
+        with ThreadPoolExecutor(max_workers=jobs or _DEFAULT_JOBS) as pool:
+            for members in pool.map(unpack_range, sorted(ranges, key=lambda byte_range: byte_range[0] - byte_range[1])):
+                digests.update(members)
+        manifest = load_manifest(os.path.join(staging_folder, _PACK_MANIFEST))
+        if "base" in manifest:
+            print(f"Can't deploy part of {pack_path}: it is a delta pack")
+            return None
+        installed_files = _installed_files_for(manifest, utgtools_folder)
+        manifest["files"] = {path: entry for path, entry in manifest["files"].items()
+                             if pack_subtree(path) in selected or pack_subtree(path) is None}
+        unpacked_files = _place_staged_blobs(manifest, staging_folder, utgtools_folder, digests)
+        _finish_unpack(manifest, installed_files, utgtools_folder)
+        return unpacked_files
+    except _CORRUPT_PACK_ERRORS as e:
+        print(f"Can't deploy part of {pack_path}: {e}")
+        return None
+    finally:
+        rmtree(staging_folder, ignore_errors=True)
+        # Subtrees are read again in full: a journal left by an interrupted unpack doesn't describe this slot anymore
+        _remove_file(os.path.join(utgtools_folder, _DEPLOY_JOURNAL))
+
+
+class DeployJournal(object):
+    """
+    Append-only record of the pack members an unpack has fully written and verified, so an interrupted deploy resumes
+    where it stopped. The first line identifies the pack: a journal left by another pack is started over. A line only
+    counts once its newline is written, so a line cut by the interruption is ignored.
+    """
+
+    def __init__(self, journal_path, pack_id):
+        self.path = journal_path
+        self.done = set()
+        self._lock = threading.Lock()
+        try:
+            with open(journal_path, "r", encoding="utf-8") as journal_file:
+                lines = journal_file.read().split("\n")
+        except IOError:
+            lines = []
+        if lines and lines[0] == pack_id:
+            self.done = set(lines[1:-1])
+            self._file = open(journal_path, "a", encoding="utf-8")
+        else:
+            self._file = open(journal_path, "w", encoding="utf-8")
+            self._file.write(pack_id + "\n")
+            self._file.flush()
+
+    @staticmethod
+    def pack_id_of(journal_path):
+        """
+        Return the identity of the pack a journal was written for, None if there is no journal
+        """
+        try:
+            with open(journal_path, "r", encoding="utf-8") as journal_file:
+                return journal_file.readline().rstrip("\n") or None
+        except IOError:
+            return None
+
+    def record(self, member_name):
+        with self._lock:
+            self._file.write(member_name + "\n")
+            self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def discard(self):
+        self.close()
+        _remove_file(self.path)
+
+
+def unpack_pack(pack_path, utgtools_folder, jobs=None):
+    """
+    Unpack a pack created by zip_utgtools into utgtools_folder.
+    Each member is extracted once by a pool of worker threads and checked against the SHA-256 of the manifest while it
+    is written; the other paths sharing its content in a deduplicated
+    pack are hardlinked to it, or copied where linking is not possible. Files deployed by a previous pack and no
+    longer part of this one are removed, and the deployed manifest is saved in the core folder.
+    A delta pack is only applied if the core folder holds the manifest of its base version.
+    Written members are recorded in a DeployJournal: when the unpack of the same pack was interrupted, the members it
+    completed are not read again, as long as their files still have the right size.
+    :param pack_path: path of the pack
+    :param utgtools_folder: folder receiving the core folder
+    :param jobs: number of worker threads, defaults to the number of cores
+    :return: number of files written, None if the pack can't be applied
+    """
+    try:
+        with zipfile.ZipFile(pack_path, 'r') as zip_ref:
+            manifest = read_pack_manifest(zip_ref)
+            members = {member.filename: member for member in zip_ref.infolist()}
+    except _CORRUPT_PACK_ERRORS as e:
+        print(f"Can't deploy {pack_path}: {e}")
+        return None
+    if manifest is None:
+        _remove_file(os.path.join(utgtools_folder, _DEPLOY_JOURNAL))
+        try:
+            return extract_zip(pack_path, utgtools_folder, jobs)
+        except _CORRUPT_PACK_ERRORS as e:
+            print(f"Can't deploy {pack_path}: {e}")
+            return None
+
+    try:
+        installed_files = _installed_files_for(manifest, utgtools_folder)
+    except ValueError as e:
+        print(f"Can't deploy {pack_path}: {e}")
+        return None
+    targets = _blob_targets(manifest, utgtools_folder)
+    digests = {entry["blob"]: entry["sha256"] for entry in manifest["files"].values()}
+    sizes = {entry["blob"]: entry["size"] for entry in manifest["files"].values()}
+
+    os.makedirs(utgtools_folder, exist_ok=True)
+    journal = DeployJournal(os.path.join(utgtools_folder, _DEPLOY_JOURNAL), pack_identity(manifest))
+    pending = [blob for blob in targets
+               if blob not in journal.done or any(_file_size(path) != sizes[blob] for path in targets[blob])]
+    if len(pending) < len(targets):
+        print(f"Resuming an interrupted deploy: {len(targets) - len(pending)} members already written")
+    handles = ZipHandles(pack_path)
+
+    def unpack_blob(blob):
+        first_path, *other_paths = targets[blob]
+        _extract_member(handles.get(), members[blob], first_path, digests[blob])
+        _link_copies(first_path, other_paths)
+        journal.record(blob)
+        return 1 + len(other_paths)
+
+    try:
+        with ThreadPoolExecutor(max_workers=jobs or _DEFAULT_JOBS) as pool:
+            unpacked_files = sum(pool.map(unpack_blob, sorted(pending, key=lambda blob: members[blob].file_size,
+                                                              reverse=True)))
+    except _CORRUPT_PACK_ERRORS + (KeyError,) as e:
+        journal.close()
+        print(f"Can't deploy {pack_path}: {e}")
+        return None
+    finally:
+        handles.close()
+
+    _finish_unpack(manifest, installed_files, utgtools_folder)
+    journal.discard()
+    return unpacked_files
+
+
+class _StreamReader(object):
+    """
+    Sequential reader over a pack stream, able to push back bytes read past the end of a member
+    """
+
+    def __init__(self, raw):
+        self.raw = raw
+        self._pending = b""
+
+    def read(self, size):
+        if self._pending:
+            data, self._pending = self._pending[:size], self._pending[size:]
+            return data
+        return self.raw.read(size)
+
+    def read_exact(self, size):
+        chunks = []
+        while size:
+            chunk = self.read(size)
+            if not chunk:
+                raise zipfile.BadZipFile("Unexpected end of pack stream")
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b"".join(chunks)
+
+    def read_signature(self):
+        """
+        Read the signature of the next zip record. A read can return fewer bytes than asked, e.g. the last bytes
+        pushed back after a data descriptor, so the 4 bytes are gathered in a loop
+        :return: the signature, empty at the end of the stream
+        """
+        signature = self.read(4)
+        while signature and len(signature) < 4:
+            chunk = self.read(4 - len(signature))
+            if not chunk:
+                raise zipfile.BadZipFile("Unexpected end of pack stream")
+            signature += chunk
+        return signature
+
+    def unread(self, data):
+        self._pending = data + self._pending
+
+
+def _inflate(decompressor, data):
+    """
+    Decompress data in bounded pieces, so a highly compressed chunk never expands all at once in memory
+    """
+    while not decompressor.eof:
+        output = decompressor.decompress(data, _EXTRACT_BUFFER_SIZE)
+        yield output
+        data = decompressor.unconsumed_tail
+        if not data and len(output) < _EXTRACT_BUFFER_SIZE:
+            break  # input consumed and no output left pending
+
+
+def _read_stream_member(reader, target_path):
+    """
+    Read the member whose local header signature was just consumed from a pack stream and write it to target_path.
+    Members with a data descriptor must be deflated: the end of the deflate stream tells where the data ends.
+    :return: (member name, SHA-256 of its content)
+    """
+    version, flags, compress_type, dos_time, dos_date, crc, compress_size, file_size, name_length, extra_length = \
+        struct.unpack("<5H3L2H", reader.read_exact(26))
+    name = reader.read_exact(name_length).decode("utf-8" if flags & 0x800 else "cp437")
+    extra = reader.read_exact(extra_length)
+    zip64 = False
+    while len(extra) >= 4:
+        field_id, field_size = struct.unpack("<HH", extra[:4])
+        if field_id == 1:
+            zip64 = True
+            if compress_size == 0xFFFFFFFF and field_size >= 16:
+                file_size, compress_size = struct.unpack("<QQ", extra[4:20])
+        extra = extra[4 + field_size:]
+
+    if compress_type not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+        raise zipfile.BadZipFile(f"Unsupported compression for {name}")
+    if flags & 0x08 and compress_type != zipfile.ZIP_DEFLATED:
+        raise zipfile.BadZipFile(f"Can't find the end of stored member {name} in a stream")
+    decompressor = zlib.decompressobj(-15) if compress_type == zipfile.ZIP_DEFLATED else None
+    actual_crc = 0
+    digest = hashlib.sha256()
+
+    target_path = _member_target_path(target_path, name)
+    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+    with open(target_path, "wb") as target:
+        if flags & 0x08:
+            while not decompressor.eof:
+                chunk = reader.read(_EXTRACT_BUFFER_SIZE)
+                if not chunk:
+                    raise zipfile.BadZipFile("Unexpected end of pack stream")
+                for data in _inflate(decompressor, chunk):
+                    actual_crc = zlib.crc32(data, actual_crc)
+                    digest.update(data)
+                    target.write(data)
+            reader.unread(decompressor.unused_data)
+            descriptor = reader.read_exact(4)
+            if descriptor != b"PK\x07\x08":  # the descriptor signature is optional
+                reader.unread(descriptor)
+            crc = struct.unpack("<L", reader.read_exact(4))[0]
+            reader.read_exact(16 if zip64 else 8)
+        else:
+            remaining = compress_size
+            while remaining:
+                chunk = reader.read(min(_EXTRACT_BUFFER_SIZE, remaining))
+                if not chunk:
+                    raise zipfile.BadZipFile("Unexpected end of pack stream")
+                remaining -= len(chunk)
+                for data in (_inflate(decompressor, chunk) if decompressor else (chunk,)):
+                    actual_crc = zlib.crc32(data, actual_crc)
+                    digest.update(data)
+                    target.write(data)
+    if actual_crc != crc:
+        raise zipfile.BadZipFile(f"Bad CRC-32 for {name}")
+    return name, digest.hexdigest()
+
+
+def unpack_stream(stream, utgtools_folder):
+    """
+    Unpack a pack while it is being received, e.g. from the standard input or a socket. The stream is read strictly
+    in order, without seeking: members are written to a staging folder as they arrive and, once the manifest at the
+    end of the pack has been read, checked against it with the SHA-256 computed while they were written, then moved
+    (or linked) to their paths. A delta pack is only applied if the core folder
+    holds the manifest of its base version.
+    :param stream: binary file object positioned at the start of the pack
+    :param utgtools_folder: folder receiving the core folder
+    :return: number of files written, None if the pack can't be applied
+    """
+    staging_folder = os.path.join(utgtools_folder, _STREAM_STAGING_DIR)
+    rmtree(staging_folder, ignore_errors=True)
+    reader = _StreamReader(stream)
+    digests = {}
+    try:
+        while True:
+            signature = reader.read_signature()
+            if signature in _CENTRAL_DIRECTORY_SIGNATURES:
+                break  # every member was received
+            if signature != b"PK\x03\x04":
+                # A stream cut between two members must not pass for a complete pack
+                raise zipfile.BadZipFile("Unexpected data in pack stream" if signature else "Pack stream truncated")
+            name, sha256 = _read_stream_member(reader, staging_folder)
+            digests[name] = sha256
+        while reader.read(_EXTRACT_BUFFER_SIZE):
+            pass  # drain the central directory so the sender can finish cleanly
+
+        if _PACK_MANIFEST not in digests:
+            for name in digests:
+                target_path = _member_target_path(utgtools_folder, name)
+                os.makedirs(os.path.dirname(target_path), exist_ok=True)
+                os.replace(_member_target_path(staging_folder, name), target_path)
+            return len(digests)
+
+        manifest = load_manifest(os.path.join(staging_folder, _PACK_MANIFEST))
+        try:
+            installed_files = _installed_files_for(manifest, utgtools_folder)
+        except ValueError as e:
+            print(f"Can't deploy the received pack: {e}")
+            return None
+        unpacked_files = _place_staged_blobs(manifest, staging_folder, utgtools_folder, digests)
+        _finish_unpack(manifest, installed_files, utgtools_folder)
+        return unpacked_files
+    except _CORRUPT_PACK_ERRORS as e:
+        print(f"Can't deploy the received pack: {e}")
+        return None
+    finally:
+        rmtree(staging_folder, ignore_errors=True)
+        # Streams can't resume: a journal left by an interrupted unpack doesn't describe this slot anymore
+        _remove_file(os.path.join(utgtools_folder, _DEPLOY_JOURNAL))
+
+
+def verify_tree(files, utgtools_folder, jobs=None, machine_specific=()):
+    """
+    Check that a deployed core folder holds every file of a manifest, with the right size. Contents were already
+    checked while they were written, so this only walks the tree (see walk_tree) and doesn't read the files again.
+    :param files: manifest files, pack path -> entry
+    :param utgtools_folder: folder holding the core folder
+    :param jobs: number of folders listed at once
+    :param machine_specific: pack paths rewritten for the machine by a previous deploy, only checked to exist
+    :return: list of problems, empty if the tree matches
+    """
+    sizes = {os.path.relpath(entry.path, utgtools_folder).replace(os.sep, "/"): entry.size
+             for entry in walk_tree(os.path.join(utgtools_folder, _CORE_DIR), jobs)}
+    problems = []
+    for path, entry in sorted(files.items()):
+        if path not in sizes:
+            problems.append(f"{path} is missing")
+        elif sizes[path] != entry["size"] and path not in machine_specific:
+            problems.append(f"{path} is {sizes[path]} bytes instead of {entry['size']}")
+    return problems
+
+
+def _is_link(path):
+    """
+    Tell whether path is a symbolic link or a directory junction
+    """
+    if os.name != "nt":
+        return os.path.islink(path)
+    # Python 3.7 reports junctions as plain folders: ask Windows whether path is a reparse point
+    from ctypes import wintypes
+    kernel32 = ctypes.WinDLL("kernel32")
+    kernel32.GetFileAttributesW.restype = wintypes.DWORD
+    kernel32.GetFileAttributesW.argtypes = (wintypes.LPCWSTR,)
+    attributes = kernel32.GetFileAttributesW(path)
+    return attributes != 0xFFFFFFFF and bool(attributes & 0x400)  # INVALID_FILE_ATTRIBUTES, FILE_ATTRIBUTE_REPARSE_POINT
+
+
+def _point_link(link_path, target):
+    """
+    Make link_path a directory junction to target, or a symbolic link outside Windows, replacing the previous link.
+    Processes running from the previous target are not disturbed: only the link changes.
+    """
+    if os.name == "nt":
+        # Junctions need no privilege, but can't be replaced in a single step
+        if _is_link(link_path):
+            os.rmdir(link_path)
+        result = _RUNNER.call("mklink", ["cmd", "/c", "mklink", "/J", link_path, target], echo=False)
+        if result.returncode != 0:
+            raise OSError(f"mklink /J {link_path} failed: {result.error or result.output}")
+    else:
+        temp_link = link_path + ".new"
+        if _is_link(temp_link):
+            os.remove(temp_link)
+        os.symlink(os.path.relpath(target, os.path.dirname(link_path)), temp_link, target_is_directory=True)
+        os.replace(temp_link, link_path)
+
+
+def _slot_folders(utgtools_folder):
+    """
+    Return the folders of the deploy slots, each receiving a core folder
+    """
+    return [os.path.join(utgtools_folder, _DEPLOY_SLOTS_DIR, slot) for slot in _DEPLOY_SLOTS]
+
+
+def live_slot(utgtools_folder):
+    """
+    Return the slot folder the core folder links to, None if the core folder is not a link to a slot
+    """
+    core_folder = os.path.join(utgtools_folder, _CORE_DIR)
+    if not _is_link(core_folder):
+        return None
+    # realpath doesn't resolve junctions before Python 3.8, but stat follows them
+    for slot_folder in _slot_folders(utgtools_folder):
+        try:
+            if os.path.samefile(core_folder, os.path.join(slot_folder, _CORE_DIR)):
+                return slot_folder
+        except OSError:
+            continue
+    return None
+
+
+def prepare_staging_slot(utgtools_folder, jobs=None, pack_id=None):
+    """
+    Prepare the slot a deploy unpacks into while the live slot keeps being used. A core folder installed in place
+    first becomes the live slot. The staging slot starts as hardlinks of the live one, so unchanged files cost nothing
+    and delta packs find their base; unpacking replaces files instead of writing through the links. The staging slot
+    of an interrupted deploy of the same pack is kept as it is, to resume from its journal: one left by another pack
+    holds files of neither version and is rebuilt.
+    Raise OSError if a folder is in use and can't be moved or removed.
+    :param pack_id: identity of the pack about to be unpacked (see pack_identity), None if it can't resume
+    :return: the staging slot folder
+    """
+    core_folder = os.path.join(utgtools_folder, _CORE_DIR)
+    slot_folders = _slot_folders(utgtools_folder)
+    live_folder = live_slot(utgtools_folder)
+    if live_folder is None and os.path.isdir(core_folder):
+        os.makedirs(slot_folders[0], exist_ok=True)
+        os.rename(core_folder, os.path.join(slot_folders[0], _CORE_DIR))
+        _point_link(core_folder, os.path.join(slot_folders[0], _CORE_DIR))
+        live_folder = slot_folders[0]
+    staging_folder = slot_folders[1] if live_folder == slot_folders[0] else slot_folders[0]
+
+    # The previous version is about to be overwritten: there is nothing to roll back to anymore
+    _remove_file(os.path.join(utgtools_folder, _DEPLOY_SLOTS_DIR, _PREVIOUS_SLOT_FILE))
+    if pack_id is not None and DeployJournal.pack_id_of(os.path.join(staging_folder, _DEPLOY_JOURNAL)) == pack_id:
+        return staging_folder
+    if os.path.isdir(staging_folder):
+        rmtree(staging_folder)
+    os.makedirs(staging_folder)
+    if live_folder is not None:
+        materialise_tree(os.path.join(live_folder, _CORE_DIR), os.path.join(staging_folder, _CORE_DIR), jobs)
+    return staging_folder
+
+
+def switch_slot(utgtools_folder, slot_folder):
+    """
+    Make slot_folder the live slot, remembering the current one for rollback
+    """
+    live_folder = live_slot(utgtools_folder)
+    _point_link(os.path.join(utgtools_folder, _CORE_DIR), os.path.join(slot_folder, _CORE_DIR))
+    previous_slot_file = os.path.join(utgtools_folder, _DEPLOY_SLOTS_DIR, _PREVIOUS_SLOT_FILE)
+    if live_folder is None:
+        _remove_file(previous_slot_file)
+        return
+    with open(previous_slot_file, "w") as previous_file:
+        previous_file.write(os.path.basename(live_folder))
+
+
+def rollback(utgtools_folder):
+    """
+    Switch back to the version deployed before the live one. Running it again goes forward to the live version.
+    :return: the slot folder now live, None if there is no previous version
+    """
+    try:
+        with open(os.path.join(utgtools_folder, _DEPLOY_SLOTS_DIR, _PREVIOUS_SLOT_FILE), "r") as previous_file:
+            previous_slot = previous_file.read().strip()
+    except IOError:
+        print(f"No previous version to roll back to in {utgtools_folder}")
+        return None
+    slot_folder = os.path.join(utgtools_folder, _DEPLOY_SLOTS_DIR, previous_slot)
+    try:
+        switch_slot(utgtools_folder, slot_folder)
+    except OSError as e:
+        print(f"Can't switch {utgtools_folder} back to the previous version: {e}")
+        return None
+    return slot_folder
+
+
+def deploy_pack(pack_path, local_folder, unit, release_folder, add_to_path, jobs=None, only=None, remote=False,
+                profile=False):
+    """
+    Deploy a pack created by zip_utgtools on this machine: unpack it in the local folder, checking every file as it is
+    written, then redo the machine-specific steps of install_rez. The folder is remapped to unit, the rez virtualenv
+    is relocated if it was packed from another core folder, and rezconfig.py and the environment variables are written
+    for this machine.
+    All of it happens in a staging slot (see prepare_staging_slot): the core folder only switches to it once it is
+    complete, and the previous version stays available to rollback.
+    :param pack_path: path of the pack, or a stream (see open_pack_stream)
+    :param local_folder: folder receiving the installation
+    :param unit: unit letter the installation is remapped to, if any
+    :param release_folder: remote folder holding the released packages, if any
+    :param add_to_path: add rez to the user's Path env var
+    :param jobs: number of worker threads, defaults to the number of cores
+    :param only: if given, package requests to deploy alone (see unpack_subtrees)
+    :param remote: local_folder is the mounted root of another machine. Its files are written with the paths that
+                   machine sees (unit, or local_folder itself) and nothing is mapped or set on this machine
+    :param profile: also run every step under cProfile (see StepTimer.write_report)
+    :return: the core folder, None if the pack can't be deployed
+    """
+    timer = StepTimer(profile)
+    utgtools_folder = os.path.join(local_folder, _TOOLSET_NAME)
+    with timer.step("staging"):
+        try:
+            # Only the unpack of a whole pack file resumes from a journal
+            resumable = not only and not is_pack_stream(pack_path)
+            slot_folder = prepare_staging_slot(utgtools_folder, jobs,
+                                               read_pack_identity(pack_path) if resumable else None)
+        except OSError as e:
+            print(f"Can't prepare the staging slot in {utgtools_folder} (is the previous version still in use?): {e}")
+            return None
+    with timer.step("unpack"):
+        if only and is_pack_stream(pack_path):
+            print("Can't deploy part of a streamed pack: --only needs a pack file")
+            unpacked_files = None
+        elif only:
+            unpacked_files = unpack_subtrees(pack_path, slot_folder, only, jobs)
+        elif is_pack_stream(pack_path):
+            with open_pack_stream(pack_path, "rb") as stream:
+                unpacked_files = unpack_stream(stream, slot_folder)
+        else:
+            unpacked_files = unpack_pack(pack_path, slot_folder, jobs)
+    if unpacked_files is None:
+        return None
+    print(f"{unpacked_files} files unpacked and verified")
+
+    staged_core_folder = os.path.join(slot_folder, _CORE_DIR)
+    installed_manifest = {}
+    with timer.step("check"):
+        try:
+            installed_manifest = load_manifest(os.path.join(staged_core_folder, _INSTALLED_MANIFEST))
+        except (IOError, ValueError):
+            print("The pack has no manifest, the deployed files can't be checked")
+        staged_rez_folder = os.path.join(staged_core_folder, "rez")
+        machine_specific = {os.path.relpath(path, slot_folder).replace(os.sep, "/")
+                            for path in (_relocatable_files(staged_rez_folder) if os.path.isdir(staged_rez_folder) else ())}
+        machine_specific.update({f"{_CORE_DIR}/installation_log.txt", f"{_CORE_DIR}/rez/rezconfig.py"})
+        problems = verify_tree(installed_manifest.get("files", {}), slot_folder, jobs, machine_specific)
+    if problems:
+        print(f"The deployed core folder doesn't match the pack:\n" + "\n".join(problems))
+        return None
+
+    if remote:
+        install_folder = unit.upper() + ":\\" if unit else utgtools_folder
+        release_packages_path = release_packages_path_for(release_folder) if release_folder is not None else None
+    else:
+        with timer.step("folder setup"):
+            install_folder, release_packages_path = setup_folder_structure(local_folder, unit, release_folder)
+    # Paths written for this machine point to the live core folder, whichever slot it links to
+    core_folder = os.path.join(install_folder, _CORE_DIR)
+    rez_folder = os.path.join(core_folder, "rez")
+
+    origin = installed_manifest.get("origin")
+    if origin and os.path.normcase(origin.rstrip("\\/")) != os.path.normcase(core_folder.rstrip("\\/")):
+        with timer.step("relocate"):
+            patched_files = relocate_rez_image(staged_rez_folder, origin, core_folder)
+        print(f"rez relocated from {origin}, {patched_files} files patched")
+
+    with timer.step("rezconfig"):
+        setup_rezconfig_file(os.path.join(rez_folder, "packages"), release_packages_path,
+                             os.path.join(staged_core_folder, "rez"), set_env=not remote)
+    write_installation_log(staged_core_folder, local_folder, unit, install_folder, release_folder)
+
+    with timer.step("switch"):
+        try:
+            switch_slot(utgtools_folder, slot_folder)
+        except OSError as e:
+            print(f"Can't switch {os.path.join(utgtools_folder, _CORE_DIR)} to the new version: {e}")
+            return None
+    report_path = os.path.join(utgtools_folder, _CORE_DIR, _PROFILE_REPORT)
+    if remote:
+        timer.report()
+        timer.write_report(report_path)
+        return core_folder
+
+    with timer.step("environment"):
+        if add_to_path:
+            add_rez_to_path(os.path.join(rez_folder, "Scripts", "rez"))
+        os.environ["UTGTOOLS"] = core_folder
+        _RUNNER.call("setx UTGTOOLS", ["setx.exe", "UTGTOOLS", core_folder])
+    print(f"\nUTGTOOLS env var set\n")
+
+    timer.report()
+    _RUNNER.report()
+    print(f"Profile written to {timer.write_report(report_path, _RUNNER.results)}")
+    return core_folder
+
+
+def read_fleet_targets(targets_path):
+    """
+    Read a fleet target list: one local folder or mounted root per line, blank lines and # comments are skipped
+    :return: list of target folders
+    """
+    with open(targets_path, "r") as targets_file:
+        lines = [line.split("#", 1)[0].strip() for line in targets_file]
+    return [line for line in lines if line]
+
+
+def deploy_fleet(pack_path, targets, unit=None, release_folder=None, concurrency=_DEFAULT_FLEET_CONCURRENCY,
+                 retries=_DEFAULT_FLEET_RETRIES, jobs=None):
+    """
+    Deploy the same pack to many targets at once (see deploy_pack with remote=True). A failed target is retried,
+    resuming from what its previous attempt wrote, and the run ends with a summary table.
+    :param pack_path: path of the pack file
+    :param targets: list of target folders, local folders or mounted roots of other machines
+    :param unit: unit letter the targets map their folder to, if any
+    :param release_folder: remote folder holding the released packages, if any
+    :param concurrency: number of targets deployed at once
+    :param retries: number of extra attempts for a failed target
+    :param jobs: number of worker threads of each deploy, defaults to the cores shared between the targets
+    :return: list of (target, succeeded, attempts, seconds) tuples, in the order of targets
+    """
+    pack_size = os.path.getsize(pack_path)
+    concurrency = max(1, min(concurrency, len(targets) or 1))
+    jobs = jobs or max(1, _DEFAULT_JOBS // concurrency)
+
+    def deploy_target(target):
+        started = time.perf_counter()
+        for attempt in range(1, retries + 2):
+            try:
+                succeeded = deploy_pack(pack_path, target, unit, release_folder, False, jobs, remote=True) is not None
+            except (Exception, SystemExit) as e:  # setup steps exit() on errors
+                # Whatever goes wrong on one target must not stop the others nor the summary
+                print(f"[{target}] {type(e).__name__}: {e}")
+                succeeded = False
+            if succeeded:
+                break
+            print(f"[{target}] attempt {attempt} of {retries + 1} failed")
+        return target, succeeded, attempt, time.perf_counter() - started
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(deploy_target, targets))
+
+    width = max([len("Target")] + [len(target) for target in targets])
+    print(f"\n{'Target':<{width}}  Status  Attempts  Seconds     MB/s")
+    for target, succeeded, attempts, seconds in results:
+        print(f"{target:<{width}}  {'ok' if succeeded else 'FAILED':<6}  {attempts:8}  {seconds:7.2f}  "
+              f"{pack_size / 1e6 / seconds if succeeded and seconds else 0:7.1f}")
+    failed = sum(1 for result in results if not result[1])
+    print(f"{len(results) - failed} of {len(results)} targets deployed, {failed} failed")
+    return results
 
 
 def parse_arguments():
@@ -302,38 +2862,175 @@ def parse_arguments():
     parser_install = subparsers.add_parser('install', help='Create a new rez setup in the local folder')
     parser_pack = subparsers.add_parser('pack', help='Pack the existing rez given the local folder in a zip file')
     parser_deploy = subparsers.add_parser('deploy', help='Unpack and deploy to the local folder a previously zipped rez')
+    parser_image = subparsers.add_parser('image', help='Capture the rez installed in the local folder as a relocatable image')
+    parser_compile = subparsers.add_parser('compile', help='Precompile the Python files of the rez installed in the local folder')
+    subparsers.add_parser('rollback', help='Switch the local folder back to the previously deployed rez')
+    parser_fleet = subparsers.add_parser('fleet', help='Deploy a pack to many targets at once, local_folder being the '
+                                                       'file listing them')
 
-    for p in (parser_install, parser_deploy):
+    for p in (parser_install, parser_deploy, parser_fleet):
         p.add_argument("-m", "--map", action="store", type=str, dest="unit",
                         help="Map the local folder to another disk unit during the install process")
 
         p.add_argument("-r", "--release", action="store", type=str, dest="release_folder",
                         help="Set a remote folder as release_packages_path")
 
+    for p in (parser_install, parser_deploy):
         p.add_argument("-p", "--path", action="store_true", dest="add_to_path",
                        help="Add rez to user Path environment variable")
 
+    for p in (parser_install, parser_pack, parser_deploy):
+        p.add_argument("--profile", action="store_true", dest="profile",
+                       help="Also dump the cProfile stats of every step next to the JSON step report")
+
+    parser_install.add_argument("-j", "--jobs", action="store", type=int, dest="jobs", default=None,
+                                help=f"Number of threads used to extract archives (default: {_DEFAULT_JOBS})")
+    parser_install.add_argument("-b", "--bind", action="store", type=lambda value: value.split(","),
+                                dest="bind_packages", default=list(_DEFAULT_BIND_PACKAGES),
+                                help=f"Comma separated system packages to create with rez-bind "
+                                     f"(default: {','.join(_DEFAULT_BIND_PACKAGES)})")
+    parser_install.add_argument("--python", action="append", type=str, dest="interpreters", default=[],
+                                metavar="INTERPRETER_FOLDER",
+                                help="Folder of another Python interpreter (e.g. Blender's) to build as a python "
+                                     "package, versioned after its include/patchlevel.h, with python.exe at its "
+                                     "root or in its bin folder. Can be repeated")
+    parser_install.add_argument("-a", "--artifacts", action="store", type=str, dest="artifact_folder",
+                                help="Folder shared between machines caching the built python packages: they are "
+                                     "fetched from it when built from the same files, published to it otherwise")
+    parser_install.add_argument("--prefer-links", action="store_true", dest="prefer_links",
+                                help="Build the python packages of interpreters on the volume of the packages folder "
+                                     "as hardlinks instead of fetching copies from the artifact folder")
+    parser_install.add_argument("-f", "--full", action="store_true", dest="full",
+                                help="Rewrite every file of the portable Python, even if an unchanged copy is installed, "
+                                     "and rebuild up to date machine packages")
+    parser_install.add_argument("-c", "--cache", action="store", type=str, dest="cache_folder",
+                                default=_DEFAULT_CACHE_FOLDER,
+                                help=f"Folder of the archive extraction cache (default: {_DEFAULT_CACHE_FOLDER})")
+    parser_install.add_argument("--no-cache", action="store_const", const=None, dest="cache_folder",
+                                help="Extract the archives in the install instead of linking them from the cache")
+    parser_install.add_argument("-i", "--image", action="store", type=str, dest="image_path",
+                                help="Lay down a rez image created with the 'image' mode instead of running install.py")
+
+    parser_install.add_argument("--compile", action="store_true", dest="compile",
+                                help="Precompile the installed Python files")
+
+    parser_compile.add_argument("-j", "--jobs", action="store", type=int, dest="jobs", default=None,
+                                help="Number of compiler processes (default: number of cores)")
+
+    for p in (parser_install, parser_compile):
+        p.add_argument("--invalidation-mode", action="store", type=str, dest="compile_mode",
+                       default="unchecked-hash", choices=_PYC_INVALIDATION_MODES,
+                       help="How the interpreter checks .pyc files against sources (default: unchecked-hash)")
+
+    parser_pack.add_argument("-o", "--output", action="store", type=str, dest="pack_path",
+                             help=f"Path of the pack (default: <local_folder>/utgtools/redist/{_DEFAULT_PACK_NAME}), "
+                                  f"'-' for the standard output or tcp://host:port to send it to a deploying machine")
+    parser_pack.add_argument("-l", "--level", action="store", type=int, dest="level", default=_DEFAULT_PACK_LEVEL,
+                             choices=range(10), metavar="{0-9}",
+                             help=f"Compression level, 0 stores files uncompressed (default: {_DEFAULT_PACK_LEVEL})")
+    parser_pack.add_argument("-j", "--jobs", action="store", type=int, dest="jobs", default=None,
+                             help="Number of compression processes (default: number of cores)")
+    parser_pack.add_argument("--fixed", action="store_false", dest="adaptive",
+                             help="Compress every file at the given level instead of storing incompressible files and "
+                                  "using a fast level on poorly compressible ones")
+    parser_pack.add_argument("-d", "--dedupe", action="store_true", dest="dedupe",
+                             help="Store identical files once")
+    parser_pack.add_argument("-s", "--since", action="store", type=str, dest="since",
+                             help="Manifest (or pack) of a previous version: only pack what changed since then")
+
+    parser_deploy.add_argument("-k", "--pack", action="store", type=str, dest="pack_path", required=True,
+                               help="Path of the pack to deploy, '-' for the standard input or tcp://[host]:port to "
+                                    "receive it from a packing machine")
+    parser_deploy.add_argument("-j", "--jobs", action="store", type=int, dest="jobs", default=None,
+                               help="Number of threads used to unpack (default: number of cores)")
+    parser_deploy.add_argument("-o", "--only", action="store", type=lambda value: value.split(","), dest="only",
+                               help="Comma separated rez packages to deploy, as family or family-version "
+                                    "(e.g. python,blender-2.83): only their part of the pack is read")
+
+    parser_fleet.add_argument("-k", "--pack", action="store", type=str, dest="pack_path", required=True,
+                              help="Path of the pack to deploy")
+    parser_fleet.add_argument("-c", "--concurrency", action="store", type=int, dest="concurrency",
+                              default=_DEFAULT_FLEET_CONCURRENCY,
+                              help=f"Number of targets deployed at once (default: {_DEFAULT_FLEET_CONCURRENCY})")
+    parser_fleet.add_argument("--retries", action="store", type=int, dest="retries", default=_DEFAULT_FLEET_RETRIES,
+                              help=f"Extra attempts for a failed target (default: {_DEFAULT_FLEET_RETRIES})")
+    parser_fleet.add_argument("-j", "--jobs", action="store", type=int, dest="jobs", default=None,
+                              help="Number of threads used to unpack on each target (default: cores / concurrency)")
+
+    parser_image.add_argument("-o", "--output", action="store", type=str, dest="image_path",
+                              help="Path of the image file (default: <local_folder>/utgtools/redist/RezImage.zip)")
+
     parser.add_argument("local_folder", type=str,
                           help="rez local folder")
 
     args = parser.parse_args()
 
+    if args.mode == "pack" and args.pack_path == "-":
+        sys.stdout = sys.stderr  # the standard output carries the pack
+    print(f"RED REZ - Redistributable Rez installer\n")
+
     if args.mode == "install":
         print(f"Creating a new rez setup:\n"
               f"Local folder: {args.local_folder}\n"
               f"Map unit: {args.unit}\n"
               f"Remote packages folder: {args.release_folder}")
-        utgtools_folder = install_rez(args.local_folder, args.unit, args.release_folder, args.add_to_path)
-        print(f"Success - Rez is now ready in: {utgtools_folder}")
+        installed = install_rez(args.local_folder, args.unit, args.release_folder, args.add_to_path,
+                                args.jobs, args.full, args.cache_folder, args.image_path,
+                                args.compile_mode if args.compile else None, args.bind_packages,
+                                args.interpreters, args.artifact_folder, args.profile, args.prefer_links)
+        if installed is None:
+            print("Failed - rez could not be installed")
+            sys.exit(1)
+        utgtools_folder, packages_built = installed
+        if packages_built:
+            print(f"Success - Rez is now ready in: {utgtools_folder}")
+        else:
+            print(f"Failed - Rez is installed in {utgtools_folder}, but some machine packages could not be made "
+                  f"(see above)")
+        files, size = disk_usage(utgtools_folder, args.jobs)
+        print(f"{files} files, {size / 1e6:.1f} MB")
+        if not packages_built:
+            sys.exit(1)
+
+    if args.mode == "image":
+        install_folder = os.path.join(args.local_folder, _TOOLSET_NAME)
+        image_path = args.image_path or os.path.join(install_folder, "redist", "RezImage.zip")
+        captured_files = create_rez_image(os.path.join(install_folder, _CORE_DIR), image_path)
+        print(f"{captured_files} files captured in {image_path}")
+
+    if args.mode == "compile":
+        utgtools_folder = os.path.join(args.local_folder, _TOOLSET_NAME, _CORE_DIR)
+        if compile_core(utgtools_folder, args.jobs, args.compile_mode):
+            print(f"Python files compiled in {utgtools_folder}")
 
     if args.mode == "pack":
         print(f"Pack stuff contained in {args.local_folder}")
+        stats = zip_utgtools(os.path.join(args.local_folder, _TOOLSET_NAME), args.pack_path, args.level, args.jobs,
+                             args.dedupe, args.since, args.adaptive, args.profile)
+        print(f"Success - Pack {'sent to' if is_pack_stream(stats['pack']) else 'is ready in'}: {stats['pack']}")
 
     if args.mode == "deploy":
         print(f"Unpack zip content to {args.local_folder} and map to {args.unit}")
+        utgtools_folder = deploy_pack(args.pack_path, args.local_folder, args.unit, args.release_folder,
+                                      args.add_to_path, args.jobs, args.only, profile=args.profile)
+        if utgtools_folder is not None:
+            files, size = disk_usage(os.path.join(args.local_folder, _TOOLSET_NAME, _CORE_DIR), args.jobs)
+            print(f"Success - Rez is now ready in: {utgtools_folder}\n{files} files, {size / 1e6:.1f} MB")
+
+    if args.mode == "fleet":
+        targets = read_fleet_targets(args.local_folder)
+        print(f"Deploy {args.pack_path} to {len(targets)} targets, {args.concurrency} at a time")
+        results = deploy_fleet(args.pack_path, targets, args.unit, args.release_folder, args.concurrency, args.retries,
+                               args.jobs)
+        if not all(result[1] for result in results):
+            sys.exit(1)
+
+    if args.mode == "rollback":
+        slot_folder = rollback(os.path.join(args.local_folder, _TOOLSET_NAME))
+        if slot_folder is not None:
+            print(f"Success - Rolled back to the rez deployed in {slot_folder}")
 
 
 if __name__ == "__main__":
-    print(f"RED REZ - Redistributable Rez installer\n")
     parse_arguments()
 
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+"""
+Delta packs created with --since: they only carry the changed files, list the deleted ones and apply on their base
+version alone.
+"""
+
+import os
+import sys
+import tempfile
+import types
+import unittest
+from shutil import rmtree
+
+sys.modules.setdefault("winreg", types.ModuleType("winreg"))  # only the Windows setup steps use it
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import redrez  # noqa: E402
+
+
+class DeltaPackTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.source = os.path.join(self.folder, "source", redrez._TOOLSET_NAME)
+        self.write_source({"kept.txt": "kept", "changed.txt": "v1", "deleted.txt": "deleted"})
+        self.base = self.pack("base")
+        self.write_source({"changed.txt": "v2", "added.txt": "added"})
+        os.remove(os.path.join(self.source, redrez._CORE_DIR, "deleted.txt"))
+        self.delta = self.pack("delta", since=os.path.join(self.folder, "base.manifest.json"))
+
+    def tearDown(self):
+        rmtree(self.folder, ignore_errors=True)
+
+    def write_source(self, files):
+        for name, content in files.items():
+            path = os.path.join(self.source, redrez._CORE_DIR, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as source:
+                source.write(content)
+
+    def pack(self, name, since=None):
+        return redrez.zip_utgtools(self.source, os.path.join(self.folder, f"{name}.zip"), 6, 1, since=since)["pack"]
+
+    def read_tree(self, utgtools_folder):
+        core_folder = os.path.join(utgtools_folder, redrez._CORE_DIR)
+        tree = {}
+        for name in os.listdir(core_folder):
+            if name != redrez._INSTALLED_MANIFEST:
+                with open(os.path.join(core_folder, name)) as deployed:
+                    tree[name] = deployed.read()
+        return tree
+
+    def test_delta_manifest(self):
+        base_files = redrez.load_manifest(os.path.join(self.folder, "base.manifest.json"))["files"]
+        manifest = redrez.load_manifest(os.path.join(self.folder, "delta.manifest.json"))
+        self.assertEqual(manifest["base"], redrez.manifest_digest(base_files))
+        self.assertEqual(manifest["deleted"], ["core/deleted.txt"])
+        self.assertIsNone(manifest["files"]["core/kept.txt"]["blob"])
+        self.assertIsNotNone(manifest["files"]["core/changed.txt"]["blob"])
+        self.assertIsNotNone(manifest["files"]["core/added.txt"]["blob"])
+
+    def test_delta_applies_on_its_base(self):
+        destination = os.path.join(self.folder, "destination")
+        self.assertEqual(redrez.unpack_pack(self.base, destination, 1), 3)
+        self.assertEqual(redrez.unpack_pack(self.delta, destination, 1), 2)
+        self.assertEqual(self.read_tree(destination), {"kept.txt": "kept", "changed.txt": "v2", "added.txt": "added"})
+
+    def test_delta_applies_on_its_base_as_a_stream(self):
+        destination = os.path.join(self.folder, "destination")
+        redrez.unpack_pack(self.base, destination, 1)
+        with open(self.delta, "rb") as stream:
+            self.assertEqual(redrez.unpack_stream(stream, destination), 2)
+        self.assertEqual(self.read_tree(destination), {"kept.txt": "kept", "changed.txt": "v2", "added.txt": "added"})
+
+    def test_delta_is_refused_without_its_base(self):
+        destination = os.path.join(self.folder, "destination")
+        self.assertIsNone(redrez.unpack_pack(self.delta, destination, 1))
+        self.write_source({"kept.txt": "another version"})
+        redrez.unpack_pack(self.pack("other"), destination, 1)
+        self.assertIsNone(redrez.unpack_pack(self.delta, destination, 1))
+        self.assertEqual(self.read_tree(destination)["kept.txt"], "another version")
+
+
+if __name__ == "__main__":
+    unittest.main()
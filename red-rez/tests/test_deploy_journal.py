@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+
+"""
+Deploy slots: only the pack that wrote the journal of an interrupted deploy may resume in its staging slot, and the
+core folder link always tells the live slot.
+"""
+
+import os
+import sys
+import tempfile
+import types
+import unittest
+from shutil import rmtree
+
+sys.modules.setdefault("winreg", types.ModuleType("winreg"))  # only the Windows setup steps use it
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import redrez  # noqa: E402
+
+
+class StagingSlotTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.source = os.path.join(self.folder, "source", redrez._TOOLSET_NAME)
+        self.utgtools_folder = os.path.join(self.folder, "local", redrez._TOOLSET_NAME)
+        self.write_source({"a.txt": "AAAA1", "b.txt": "b"})
+        self.first = redrez.zip_utgtools(self.source, os.path.join(self.folder, "first.zip"), 6, 1)["pack"]
+        self.write_source({"a.txt": "AAAA2"})
+        self.other = redrez.zip_utgtools(self.source, os.path.join(self.folder, "other.zip"), 6, 1)["pack"]
+        self.deploy(self.first)
+
+    def tearDown(self):
+        rmtree(self.folder, ignore_errors=True)
+
+    def write_source(self, files):
+        for name, content in files.items():
+            path = os.path.join(self.source, redrez._CORE_DIR, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as source:
+                source.write(content)
+
+    def deploy(self, pack_path):
+        slot_folder = redrez.prepare_staging_slot(self.utgtools_folder, 1, redrez.read_pack_identity(pack_path))
+        unpacked_files = redrez.unpack_pack(pack_path, slot_folder, 1)
+        if unpacked_files is not None:
+            redrez.switch_slot(self.utgtools_folder, slot_folder)
+        return slot_folder, unpacked_files
+
+    def interrupt(self, pack_path):
+        """
+        Deploy pack_path, stopping right after a.txt is written
+        """
+        extract_member = redrez._extract_member
+
+        def interrupted(zip_ref, member, path, digest):
+            extract_member(zip_ref, member, path, digest)
+            if path.endswith("a.txt"):
+                raise KeyError("interrupted")
+
+        redrez._extract_member = interrupted
+        try:
+            return self.deploy(pack_path)
+        finally:
+            redrez._extract_member = extract_member
+
+    def read_live(self, name):
+        with open(os.path.join(self.utgtools_folder, redrez._CORE_DIR, name)) as live:
+            return live.read()
+
+    def test_slot_of_another_pack_is_rebuilt(self):
+        slot_folder, unpacked_files = self.interrupt(self.other)
+        self.assertIsNone(unpacked_files)
+        self.assertTrue(os.path.exists(os.path.join(slot_folder, redrez._DEPLOY_JOURNAL)))
+        self.deploy(self.first)
+        self.assertEqual(self.read_live("a.txt"), "AAAA1")
+        self.assertFalse(os.path.exists(os.path.join(slot_folder, redrez._DEPLOY_JOURNAL)))
+
+    def test_slot_of_the_same_pack_resumes(self):
+        slot_folder, _ = self.interrupt(self.other)
+        self.assertEqual(redrez.prepare_staging_slot(self.utgtools_folder, 1, redrez.read_pack_identity(self.other)),
+                         slot_folder)
+        self.assertIsNotNone(redrez.unpack_pack(self.other, slot_folder, 1))
+        redrez.switch_slot(self.utgtools_folder, slot_folder)
+        self.assertEqual(self.read_live("a.txt"), "AAAA2")
+        self.assertFalse(os.path.exists(os.path.join(slot_folder, redrez._DEPLOY_JOURNAL)))
+
+    def test_live_slot_follows_the_core_link(self):
+        slot_folder, _ = self.deploy(self.other)
+        self.assertEqual(redrez.live_slot(self.utgtools_folder), slot_folder)
+        self.assertEqual(self.read_live("a.txt"), "AAAA2")
+        self.assertNotEqual(redrez.rollback(self.utgtools_folder), slot_folder)
+        self.assertEqual(self.read_live("a.txt"), "AAAA1")
+
+    def test_failed_switch_keeps_the_live_slot(self):
+        live_folder, _ = self.deploy(self.other)
+        point_link = redrez._point_link
+
+        def failing(link_path, target):
+            raise OSError("mklink /J failed")
+
+        redrez._point_link = failing
+        try:
+            self.assertIsNone(redrez.rollback(self.utgtools_folder))
+        finally:
+            redrez._point_link = point_link
+        self.assertEqual(redrez.live_slot(self.utgtools_folder), live_folder)
+        self.assertEqual(self.read_live("a.txt"), "AAAA2")
+
+
+if __name__ == "__main__":
+    unittest.main()
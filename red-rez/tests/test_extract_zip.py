@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+"""
+Incremental extraction: only the members that changed since the previous extraction are written again.
+"""
+
+import os
+import sys
+import tempfile
+import types
+import unittest
+import zipfile
+from shutil import rmtree
+
+sys.modules.setdefault("winreg", types.ModuleType("winreg"))  # only the Windows setup steps use it
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import redrez  # noqa: E402
+
+
+class IncrementalExtractTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.zip_path = os.path.join(self.folder, "python.zip")
+        self.destination = os.path.join(self.folder, "destination")
+        self.write_zip({"python/python.exe": "exe", "python/Lib/os.py": "os", "python/Lib/removed.py": "removed"})
+        self.assertEqual(redrez.extract_zip(self.zip_path, self.destination, 2, incremental=True), 3)
+        self.write_zip({"python/python.exe": "exe", "python/Lib/os.py": "os changed"})
+
+    def tearDown(self):
+        rmtree(self.folder, ignore_errors=True)
+
+    def write_zip(self, members):
+        with zipfile.ZipFile(self.zip_path, "w", zipfile.ZIP_DEFLATED) as archive:
+            for name, content in members.items():
+                archive.writestr(name, content)
+
+    def extract(self):
+        """
+        Extract the zip again, recording the members written
+        :return: names of the members written
+        """
+        written = []
+        extract_member = redrez._extract_member
+
+        def recording(zip_ref, member, target_path, sha256=None):
+            written.append(member.filename)
+            return extract_member(zip_ref, member, target_path, sha256)
+
+        redrez._extract_member = recording
+        try:
+            redrez.extract_zip(self.zip_path, self.destination, 2, incremental=True)
+        finally:
+            redrez._extract_member = extract_member
+        return written
+
+    def read(self, name):
+        with open(os.path.join(self.destination, name)) as extracted:
+            return extracted.read()
+
+    def test_only_changed_members_are_rewritten(self):
+        self.assertEqual(self.extract(), ["python/Lib/os.py"])
+        self.assertEqual(self.read("python/Lib/os.py"), "os changed")
+        self.assertEqual(self.read("python/python.exe"), "exe")
+        self.assertFalse(os.path.exists(os.path.join(self.destination, "python", "Lib", "removed.py")))
+        self.assertEqual(self.extract(), [])
+
+    def test_missing_file_is_rewritten(self):
+        os.remove(os.path.join(self.destination, "python", "python.exe"))
+        self.assertEqual(sorted(self.extract()), ["python/Lib/os.py", "python/python.exe"])
+
+    def test_interrupted_extraction_is_resumed(self):
+        extract_member = redrez._extract_member
+
+        def interrupted(zip_ref, member, target_path, sha256=None):
+            raise OSError("interrupted")
+
+        redrez._extract_member = interrupted
+        try:
+            with self.assertRaises(OSError):
+                redrez.extract_zip(self.zip_path, self.destination, 2, incremental=True)
+        finally:
+            redrez._extract_member = extract_member
+        # The manifest written before extracting only vouches for the untouched member
+        manifest = redrez.read_extraction_manifest(redrez.extraction_manifest_path(self.zip_path, self.destination))
+        self.assertEqual(sorted(manifest), ["python/python.exe"])
+        self.assertEqual(self.extract(), ["python/Lib/os.py"])
+        self.assertEqual(self.read("python/Lib/os.py"), "os changed")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+"""
+Python packages shared between machines through a DirectoryArtifactCache: their key only depends on the interpreter
+files, and damaged archives are dropped.
+"""
+
+import os
+import sys
+import tempfile
+import types
+import unittest
+import zipfile
+from shutil import rmtree
+
+sys.modules.setdefault("winreg", types.ModuleType("winreg"))  # only the Windows setup steps use it
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import redrez  # noqa: E402
+
+
+class ArtifactCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.cache = redrez.DirectoryArtifactCache(os.path.join(self.folder, "artifacts"))
+
+    def tearDown(self):
+        rmtree(self.folder, ignore_errors=True)
+
+    def interpreter(self, name, files, mtime):
+        folder = os.path.join(self.folder, name)
+        for path, content in files.items():
+            os.makedirs(os.path.dirname(os.path.join(folder, path)), exist_ok=True)
+            with open(os.path.join(folder, path), "w") as interpreter_file:
+                interpreter_file.write(content)
+            os.utime(os.path.join(folder, path), (mtime, mtime))
+        return folder
+
+    def test_fingerprint_ignores_modification_times(self):
+        files = {"bin/python.exe": "exe", "lib/os.py": "os"}
+        first = redrez._interpreter_fingerprint(self.interpreter("first", files, 1000000000))
+        self.assertEqual(redrez._interpreter_fingerprint(self.interpreter("second", files, 1100000000)), first)
+        changed = dict(files, **{"lib/os.py": "OS"})
+        self.assertNotEqual(redrez._interpreter_fingerprint(self.interpreter("changed", changed, 1000000000)), first)
+
+    def test_fetch_of_a_published_package(self):
+        package_folder = self.interpreter("published", {"lib/os.py": "os " * 1000}, 1000000000)
+        self.assertTrue(self.cache.publish("python", "3.7.4", "key", package_folder))
+        fetched_folder = os.path.join(self.folder, "packages", "python", "3.7.4")
+        self.assertTrue(self.cache.fetch("python", "3.7.4", "key", fetched_folder))
+        with open(os.path.join(fetched_folder, "lib", "os.py")) as fetched_file:
+            self.assertEqual(fetched_file.read(), "os " * 1000)
+        self.assertFalse(self.cache.fetch("python", "3.7.5", "key", fetched_folder))
+
+    def test_corrupted_archive_is_dropped(self):
+        package_folder = self.interpreter("published", {"lib/os.py": "os " * 1000}, 1000000000)
+        self.cache.publish("python", "3.7.4", "key", package_folder)
+        archive_path = self.cache.archive_path("python", "3.7.4", "key")
+        with zipfile.ZipFile(archive_path) as archive:
+            member = archive.getinfo("lib/os.py")
+        with open(archive_path, "r+b") as archive_file:
+            archive_file.seek(member.header_offset + 26)
+            header_size = 30 + sum(int.from_bytes(archive_file.read(2), "little") for _ in range(2))
+            archive_file.seek(member.header_offset + header_size)
+            archive_file.write(b"\xff")  # an invalid deflate block type
+        fetched_folder = os.path.join(self.folder, "packages", "python", "3.7.4")
+        with self.assertRaises(redrez._CORRUPT_PACK_ERRORS):
+            self.cache.fetch("python", "3.7.4", "key", fetched_folder)
+        self.assertFalse(os.path.exists(archive_path))
+        self.assertFalse(os.path.exists(fetched_folder))
+
+
+if __name__ == "__main__":
+    unittest.main()
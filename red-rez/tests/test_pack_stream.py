@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+
+"""
+Round trips of packs written by ZipSplicer and read back as a stream, the way 'deploy -k -' and 'deploy -k tcp://'
+receive them.
+"""
+
+import io
+import os
+import sys
+import tempfile
+import types
+import unittest
+import zipfile
+import zlib
+from shutil import rmtree
+
+sys.modules.setdefault("winreg", types.ModuleType("winreg"))  # only the Windows setup steps use it
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import redrez  # noqa: E402
+
+
+class ChunkedStream(object):
+    """
+    Binary stream returning short reads that stop at the given offsets, like a pipe or a socket
+    """
+
+    def __init__(self, data, cuts):
+        self.data = data
+        self.offset = 0
+        self.cuts = sorted(cuts)
+
+    def read(self, size=-1):
+        end = len(self.data) if size < 0 else self.offset + size
+        for cut in self.cuts:
+            if self.offset < cut < end:
+                end = cut
+                break
+        data = self.data[self.offset:end]
+        self.offset += len(data)
+        return data
+
+
+class PackStreamTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.files = {"core/big.bin": os.urandom(300 * 1024), "core/small.txt": b"small " * 100,
+                      "core/last.txt": b"last"}
+        for name, content in self.files.items():
+            os.makedirs(os.path.dirname(os.path.join(self.folder, "source", name)), exist_ok=True)
+            with open(os.path.join(self.folder, "source", name), "wb") as source:
+                source.write(content)
+
+    def tearDown(self):
+        rmtree(self.folder, ignore_errors=True)
+
+    def write_pack(self):
+        """
+        Write the big file as a data descriptor member, the others with known sizes
+        :return: (pack bytes, offset of the member following the data descriptor)
+        """
+        output = io.BytesIO()
+        splicer = redrez.ZipSplicer(output)
+        big_path = os.path.join(self.folder, "source", "core", "big.bin")
+        splicer.write_streamed_member("core/big.bin", 0, 0o100644, big_path, 6)
+        boundary = splicer.offset
+        for name in ("core/small.txt", "core/last.txt"):
+            content = self.files[name]
+            data = zlib.compress(content, 6)[2:-4]
+            splicer.write_member(name, 0, 0o100644, zipfile.ZIP_DEFLATED, zlib.crc32(content), len(content), data)
+        splicer.close()
+        return output.getvalue(), boundary
+
+    def unpack(self, stream):
+        destination = os.path.join(self.folder, "destination")
+        rmtree(destination, ignore_errors=True)
+        os.makedirs(destination)
+        return redrez.unpack_stream(stream, destination), destination
+
+    def test_zipfile_reads_the_pack(self):
+        data, _ = self.write_pack()
+        with zipfile.ZipFile(io.BytesIO(data)) as pack:
+            self.assertIsNone(pack.testzip())
+            self.assertEqual({name: pack.read(name) for name in pack.namelist()}, self.files)
+
+    def test_read_stream_member_round_trip(self):
+        data, boundary = self.write_pack()
+        reader = redrez._StreamReader(io.BytesIO(data))
+        self.assertEqual(reader.read_signature(), b"PK\x03\x04")
+        name, _ = redrez._read_stream_member(reader, os.path.join(self.folder, "member"))
+        self.assertEqual(name, "core/big.bin")
+        with open(os.path.join(self.folder, "member", name), "rb") as member:
+            self.assertEqual(member.read(), self.files[name])
+        self.assertEqual(reader.read_signature(), b"PK\x03\x04")
+
+    def test_short_reads_after_a_data_descriptor(self):
+        data, boundary = self.write_pack()
+        # Only 1 to 3 bytes of the next signature are left pushed back once the data descriptor is read
+        for extra in range(0, 5):
+            with self.subTest(extra=extra):
+                unpacked_files, destination = self.unpack(ChunkedStream(data, [boundary + extra]))
+                self.assertEqual(unpacked_files, len(self.files))
+                for name, content in self.files.items():
+                    with open(os.path.join(destination, name), "rb") as unpacked:
+                        self.assertEqual(unpacked.read(), content)
+
+    def test_stream_cut_between_members_is_refused(self):
+        data, boundary = self.write_pack()
+        for cut in (boundary, boundary + 2):
+            with self.subTest(cut=cut):
+                unpacked_files, destination = self.unpack(ChunkedStream(data[:cut], []))
+                self.assertIsNone(unpacked_files)
+                self.assertFalse(os.path.exists(os.path.join(destination, "core", "big.bin")))
+
+    def test_corrupted_member_is_refused(self):
+        data = bytearray(self.write_pack()[0])
+        # An invalid deflate block type right at the start of the first member
+        data[30 + len("core/big.bin") + int.from_bytes(data[28:30], "little")] = 0xFF
+        pack_path = os.path.join(self.folder, "corrupted.zip")
+        with open(pack_path, "wb") as pack:
+            pack.write(data)
+        self.assertIsNone(self.unpack(io.BytesIO(bytes(data)))[0])
+        self.assertIsNone(redrez.unpack_pack(pack_path, os.path.join(self.folder, "destination"), 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+"""
+Partial deploys reading only the byte ranges of the requested rez packages from the pack index.
+"""
+
+import os
+import sys
+import tempfile
+import types
+import unittest
+from shutil import rmtree
+
+sys.modules.setdefault("winreg", types.ModuleType("winreg"))  # only the Windows setup steps use it
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import redrez  # noqa: E402
+
+
+class PartialDeployTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.source = os.path.join(self.folder, "source", redrez._TOOLSET_NAME)
+        shared = os.urandom(64 * 1024)
+        # WinPython and its python package share a file, stored once in a deduplicated pack
+        self.files = {"core/python/lib.bin": shared,
+                      "core/rez/packages/python/3.7.4/lib.bin": shared,
+                      "core/rez/packages/python/3.7.4/package.py": b"name = 'python'",
+                      "core/rez/packages/other/1.0/package.py": b"name = 'other'"}
+        for name, content in self.files.items():
+            path = os.path.join(self.source, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as source:
+                source.write(content)
+        self.pack = redrez.zip_utgtools(self.source, os.path.join(self.folder, "pack.zip"), 6, 1, dedupe=True)["pack"]
+
+    def tearDown(self):
+        rmtree(self.folder, ignore_errors=True)
+
+    def test_shared_member_is_read_once(self):
+        read_ranges = []
+        range_reader = redrez._RangeReader
+
+        def recording(pack_path, start, end):
+            read_ranges.append((start, end))
+            return range_reader(pack_path, start, end)
+
+        redrez._RangeReader = recording
+        try:
+            destination = os.path.join(self.folder, "destination")
+            self.assertIsNotNone(redrez.unpack_subtrees(self.pack, destination, ["python"], 2))
+        finally:
+            redrez._RangeReader = range_reader
+        read_ranges.sort()
+        for (_, end), (start, _) in zip(read_ranges, read_ranges[1:]):
+            self.assertLessEqual(end, start)
+        for name, content in self.files.items():
+            path = os.path.join(destination, name)
+            if name.startswith("core/rez/packages/other/"):
+                self.assertFalse(os.path.exists(path))
+                continue
+            with open(path, "rb") as unpacked:
+                self.assertEqual(unpacked.read(), content)
+
+    def test_merge_ranges(self):
+        self.assertEqual(redrez._merge_ranges([[10, 20], [0, 30], [30, 40], [35, 50]]), [[0, 30], [30, 50]])
+
+
+if __name__ == "__main__":
+    unittest.main()